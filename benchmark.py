@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+剪贴板监控器性能基准测试
+用法:
+    python benchmark.py server [--clients 50] [--requests 2000] [--keep-alive] [--path /]
+    python benchmark.py history [--sizes 100,1000,10000] [--item-size 1024]
+    python benchmark.py save [--records 2000] [--fsync never]
+    python benchmark.py search [--entries 20000] [--backend memory]
+    python benchmark.py polling [--duration 60] [--interval 1.0]
+    python benchmark.py detect [--sizes 1,100,1000,10000]
+    python benchmark.py startup [--runs 5]
+    python benchmark.py imports [--budget-ms 120]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stderr
+
+import 剪贴板监控器_fixed2 as app
+
+
+def percentile(samples, pct):
+    """计算百分位数（samples需已排序）"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(len(samples) * pct / 100))
+    return samples[index]
+
+
+def create_monitor(**config):
+    """创建使用临时配置的监控器：不读取本地 config.json，历史文件等也写在临时目录中"""
+    directory = tempfile.mkdtemp()
+    paths = {
+        'save_path': os.path.join(directory, 'clipboard_history.txt'),
+        'history_db_path': os.path.join(directory, 'clipboard_history.db'),
+        'image_dir': os.path.join(directory, 'clipboard_images'),
+    }
+    # 配置在创建监控器之前写好，构造函数读取的就是测试配置
+    config_file = os.path.join(directory, 'config.json')
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(dict(paths, **config), f)
+    return app.ClipboardMonitor(config_file)
+
+
+def fill_history(monitor, count, size=200):
+    """填充测试用的历史记录"""
+    for i in range(count):
+        monitor.add_to_history(f"{i:06d} " + "x" * size, 'text')
+
+
+def run_clients(port, path, clients, total_requests, keep_alive=False, headers=None):
+    """并发请求path，返回 (耗时, 排序后的延迟列表, 失败数)
+
+    keep_alive为True时每个客户端复用同一个连接。
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_client = max(1, total_requests // clients)
+
+    def client():
+        local = []
+        failed = 0
+        conn = None
+        for _ in range(per_client):
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                conn.request('GET', path, headers=headers or {})
+                conn.getresponse().read()
+                if not keep_alive:
+                    conn.close()
+                    conn = None
+                local.append(time.perf_counter() - start)
+            except Exception:
+                failed += 1
+                conn = None
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, sorted(latencies), sum(errors)
+
+
+def bench_server(args):
+    """对比不同服务器引擎下的吞吐量和延迟"""
+    mode = '长连接' if args.keep_alive else '短连接'
+    headers = {'Accept-Encoding': 'gzip'} if args.gzip else {}
+    print(f"{args.path} 负载测试: {args.clients} 并发客户端, {args.requests} 请求, {mode}")
+    print(f"{'引擎':<10}{'请求/秒':>12}{'p50(ms)':>12}{'p99(ms)':>12}{'失败':>8}")
+    for engine in app.SERVER_ENGINES:
+        monitor = create_monitor(server_port=0, server_engine=engine,
+                                 server_workers=args.workers)
+        fill_history(monitor, monitor.max_history)
+        with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+            monitor.start_server()
+            port = monitor.server.server_address[1]
+            elapsed, latencies, failed = run_clients(port, args.path, args.clients,
+                                                     args.requests, args.keep_alive, headers)
+            monitor.stop_server()
+        rps = len(latencies) / elapsed if elapsed else 0.0
+        print(f"{engine:<10}{rps:>12.1f}{percentile(latencies, 50) * 1000:>12.2f}"
+              f"{percentile(latencies, 99) * 1000:>12.2f}{failed:>8}")
+
+
+def legacy_add(history, content, content_type, max_history):
+    """旧版 add_to_history 的算法：线性扫描去重，切片截断"""
+    for item in history:
+        if item['content'] == content and item['type'] == content_type:
+            return history
+    history.insert(0, {'content': content, 'type': content_type})
+    if len(history) > max_history:
+        history = history[:max_history]
+    return history
+
+
+def bench_history(args):
+    """历史记录插入开销随历史长度的变化"""
+    sizes = [int(size) for size in args.sizes.split(',')]
+    inserts = args.inserts
+    print(f"插入 {inserts} 条 {args.item_size} 字节的新记录（历史记录已满）")
+    print(f"{'历史条数':<10}{'HistoryStore(us)':>18}{'旧算法(us)':>14}")
+    for size in sizes:
+        filler = "x" * args.item_size
+        store = app.HistoryStore(size)
+        legacy = []
+        for i in range(size):
+            # 前缀相同的长文本，旧算法需要逐字符比较
+            store.add(filler + str(i))
+            legacy.insert(0, {'content': filler + str(i), 'type': 'text'})
+
+        start = time.perf_counter()
+        for i in range(inserts):
+            store.add(filler + f"new{i}")
+        store_cost = (time.perf_counter() - start) / inserts
+
+        legacy_cost = float('nan')
+        if size <= args.legacy_max:
+            start = time.perf_counter()
+            for i in range(inserts):
+                legacy = legacy_add(legacy, filler + f"new{i}", 'text', size)
+            legacy_cost = (time.perf_counter() - start) / inserts
+        print(f"{size:<10}{store_cost * 1e6:>18.2f}{legacy_cost * 1e6:>14.2f}")
+
+
+def legacy_save(path, content, sync=False):
+    """旧版 save_to_file：每条记录打开一次文件"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"[2024-01-01 00:00:00] 文本: {content}\n")
+        f.write("-" * 50 + "\n")
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def bench_save(args):
+    """连续复制时保存历史文件的开销：逐条写入 vs 后台批量写入"""
+    sync = args.fsync != 'never'
+    directory = args.dir or tempfile.mkdtemp()
+    content = "x" * args.item_size
+    print(f"保存 {args.records} 条 {args.item_size} 字节的记录到 {directory}（fsync={args.fsync}）")
+    print(f"{'方式':<10}{'调用方(us/条)':>16}{'全部落盘(ms)':>16}")
+
+    path = os.path.join(directory, 'legacy.txt')
+    start = time.perf_counter()
+    for _ in range(args.records):
+        legacy_save(path, content, sync)
+    elapsed = time.perf_counter() - start
+    print(f"{'逐条写入':<10}{elapsed / args.records * 1e6:>16.2f}{elapsed * 1000:>16.1f}")
+
+    path = os.path.join(directory, 'batched.txt')
+    writer = app.HistoryWriter(flush_interval=1.0, fsync=args.fsync)
+    start = time.perf_counter()
+    for _ in range(args.records):
+        writer.write(path, f"[2024-01-01 00:00:00] 文本: {content}\n" + "-" * 50 + "\n")
+    caller = time.perf_counter() - start
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"{'批量写入':<10}{caller / args.records * 1e6:>16.2f}{elapsed * 1000:>16.1f}")
+
+
+def bench_search(args):
+    """全文搜索延迟：索引查询 vs 逐条子串扫描"""
+    import random
+    random.seed(0)
+    words = ['clipboard', 'python', 'server', 'mobile', 'history', 'search',
+             '剪贴板', '监控器', '手机', '电脑', '同步', '历史记录']
+    database = None
+    if args.backend == 'sqlite':
+        database = app.HistoryDatabase(os.path.join(tempfile.mkdtemp(), 'history.db'))
+    store = app.HistoryStore(args.entries, database=database)
+    for i in range(args.entries):
+        store.add(' '.join(random.choice(words) for _ in range(30)) + f' entry{i}')
+
+    print(f"在 {args.entries} 条记录中搜索（{args.backend}），每个查询 {args.repeat} 次")
+    print(f"{'查询':<16}{'结果':>6}{'索引(ms)':>12}{'扫描(ms)':>12}")
+    for query in ['entry123', '同步', 'python 手机', 'clip', 'nothing']:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = store.search(query, 50)
+        indexed = (time.perf_counter() - start) / args.repeat
+
+        keywords = query.lower().split()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            [item for item in store if all(k in item['content'].lower() for k in keywords)]
+        scanned = (time.perf_counter() - start) / args.repeat
+        print(f"{query:<16}{len(results):>6}{indexed * 1000:>12.2f}{scanned * 1000:>12.2f}")
+    store.close()
+
+
+def copy_schedule(duration, seed=0):
+    """模拟的复制时间表：连续复制一阵，然后空闲一段时间"""
+    import random
+    rng = random.Random(seed)
+    times = []
+    now = rng.uniform(1, 3)
+    while now < duration:
+        burst_end = now + rng.uniform(2, 6)
+        while now < min(burst_end, duration):
+            times.append(now)
+            now += rng.uniform(0.5, 2.5)
+        now += rng.uniform(10, 40)
+    return times
+
+
+def simulate_monitor(mode, schedule, duration, args):
+    """在假剪贴板上运行监控线程，返回 (检查次数, 检测延迟列表, 漏检数)"""
+    monitor = create_monitor(clipboard_backend='fake', auto_save=False,
+                             min_check_interval=args.min_interval,
+                             max_check_interval=args.max_interval)
+    monitor.clipboard_backend = app.FakeClipboardBackend(event_driven=(mode == 'event'))
+    monitor.adaptive_polling = mode != 'fixed'
+    monitor.set_check_interval(args.interval)
+
+    detected = {}
+    subscriber = monitor.events.subscribe()
+
+    def listen():
+        while True:
+            message = subscriber.get()
+            if message is None:
+                return
+            event, item = message
+            if event == 'history':
+                detected[item['content']] = time.perf_counter()
+
+    listener = threading.Thread(target=listen)
+    listener.start()
+    monitor.start_monitoring()
+    start = time.perf_counter()
+    copied = {}
+    for i, at in enumerate(schedule):
+        time.sleep(max(0, start + at - time.perf_counter()))
+        content = f"copy {i}"
+        copied[content] = time.perf_counter()
+        monitor.clipboard_backend.copy(content)
+    time.sleep(max(0, start + duration - time.perf_counter()))
+    monitor.stop_monitoring()
+    monitor.events.close()
+    listener.join()
+
+    latencies = sorted(detected[c] - t for c, t in copied.items() if c in detected)
+    return monitor.poll_scheduler.polls, latencies, len(copied) - len(latencies)
+
+
+def bench_polling(args):
+    """固定间隔轮询、自适应轮询和事件通知的唤醒次数与检测延迟"""
+    schedule = copy_schedule(args.duration)
+    print(f"模拟 {args.duration:.0f} 秒内 {len(schedule)} 次复制（连续复制后空闲）")
+    print(f"固定间隔 {args.interval}s，自适应 {args.min_interval}-{args.max_interval}s")
+    print(f"{'方式':<10}{'检查次数':>10}{'次/秒':>8}{'平均延迟(ms)':>14}{'p95(ms)':>10}{'漏检':>6}")
+    for mode in ('fixed', 'adaptive', 'event'):
+        polls, latencies, missed = simulate_monitor(mode, schedule, args.duration, args)
+        average = sum(latencies) / len(latencies) if latencies else 0.0
+        print(f"{mode:<10}{polls:>10}{polls / args.duration:>8.2f}{average * 1000:>14.1f}"
+              f"{percentile(latencies, 95) * 1000:>10.1f}{missed:>6}")
+
+
+class CopyingClipboard(app.FakeClipboardBackend):
+    """每次读取都返回新的字符串对象，和 pyperclip 一样"""
+
+    def paste(self):
+        return self.content.encode('utf-8').decode('utf-8')
+
+
+def bench_detect(args):
+    """剪贴板未变化时每次检查的开销随内容大小的变化"""
+    sizes = [int(size) for size in args.sizes.split(',')]
+    print(f"剪贴板内容不变，每种方式检查 {args.ticks} 次")
+    print(f"{'内容(KB)':<10}{'全文比较(us)':>14}{'指纹(us)':>12}{'变化计数(us)':>14}")
+    for size in sizes:
+        content = "剪" * (size * 1024 // 3)
+
+        clipboard = CopyingClipboard(content)
+        last_content = clipboard.paste()
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            current = clipboard.paste()
+            if current != last_content:
+                last_content = current
+        legacy = (time.perf_counter() - start) / args.ticks
+
+        costs = []
+        for change_counter in (False, True):
+            monitor = create_monitor(auto_save=False)
+            monitor.clipboard_backend = CopyingClipboard(content, change_counter=change_counter)
+            monitor.check_clipboard()
+            start = time.perf_counter()
+            for _ in range(args.ticks):
+                monitor.check_clipboard()
+            costs.append((time.perf_counter() - start) / args.ticks)
+        print(f"{size:<10}{legacy * 1e6:>14.1f}{costs[0] * 1e6:>12.1f}{costs[1] * 1e6:>14.2f}")
+
+
+# 两种模式都以导入模块的方式启动（直接运行脚本时每次都要重新编译，会掩盖差别）。
+# 界面模式先导入界面和二维码模块（没有显示器时无法创建窗口），其余和无界面模式相同
+STARTUP_SCRIPT = """import sys
+sys.path.insert(0, sys.argv[1])
+import 剪贴板监控器_fixed2 as app
+if sys.argv[2] == 'gui':
+    app.import_gui_modules()
+    import qrcode
+app.main(['--headless', '--config', sys.argv[3]])
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_rss(pid):
+    """进程的常驻内存(MB)，只支持 Linux"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_once(mode, workdir):
+    """启动一次进程，返回 (就绪耗时, 常驻内存MB, 收到SIGTERM后退出耗时, 退出码)"""
+    port = free_port()
+    config = os.path.join(workdir, f'config_{mode}.json')
+    with open(config, 'w', encoding='utf-8') as f:
+        json.dump({'server_port': port, 'auto_save': False}, f)
+    command = [sys.executable, '-c', STARTUP_SCRIPT,
+               os.path.dirname(os.path.abspath(app.__file__)), mode, config]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        # 服务器能响应请求即视为启动完成
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'{mode} 进程启动失败，退出码 {process.returncode}')
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                conn.request('GET', '/api/history')
+                conn.getresponse().read()
+                conn.close()
+                break
+            except OSError:
+                time.sleep(0.005)
+        ready = time.perf_counter() - start
+        rss = process_rss(process.pid)
+
+        start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        code = process.wait(timeout=10)
+        return ready, rss, time.perf_counter() - start, code
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+
+def bench_startup(args):
+    """无界面模式和界面模式（加载界面、二维码模块）的启动时间和内存"""
+    workdir = tempfile.mkdtemp()
+    print(f"从启动进程到服务器响应第一个请求，每种模式 {args.runs} 次取中位数")
+    print(f"{'模式':<12}{'启动(ms)':>10}{'内存(MB)':>10}{'SIGTERM退出(ms)':>16}{'退出码':>8}")
+    for mode in ('headless', 'gui'):
+        runs = sorted(start_once(mode, workdir) for _ in range(args.runs))
+        ready, rss, stop, code = runs[len(runs) // 2]
+        rss_text = f"{rss:.1f}" if rss is not None else '-'
+        print(f"{mode:<12}{ready * 1000:>10.1f}{rss_text:>10}{stop * 1000:>16.1f}{code:>8}")
+
+
+def import_times(env, cwd):
+    """用 python -X importtime 导入主模块一次，返回 (模块总耗时us, [(直接依赖, 累计us)])"""
+    module = app.__name__
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # 表头
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if name == module:
+            return int(cumulative), children
+        if depth == 1:
+            children.append((name, int(cumulative)))
+        elif depth == 0:
+            children = []  # 其他顶层导入（site 等）的子模块
+    raise RuntimeError(f'没有找到 {module} 的导入记录')
+
+
+def bench_imports(args):
+    """主模块的导入耗时报告，超过预算时返回非零退出码"""
+    cwd = os.path.dirname(os.path.abspath(app.__file__))
+    # 和安装后一样使用缓存的字节码，缓存放在临时目录，不写入源码目录
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=tempfile.mkdtemp())
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    import_times(env, cwd)
+    # 取最快的一次，减少机器负载的影响
+    total, children = min(import_times(env, cwd) for _ in range(args.runs))
+
+    print(f"导入 {app.__name__}（{args.runs} 次中最快的一次，不含解释器启动）")
+    print(f"{'模块':<28}{'累计(ms)':>10}")
+    for name, cumulative in sorted(children, key=lambda c: -c[1])[:args.top]:
+        print(f"{name:<28}{cumulative / 1000:>10.1f}")
+    print(f"{'合计':<28}{total / 1000:>10.1f}")
+    if total / 1000 > args.budget_ms:
+        print(f"超出预算 {args.budget_ms:.0f} ms")
+        return 1
+    print(f"在预算 {args.budget_ms:.0f} ms 之内")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='剪贴板监控器性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    server_parser = subparsers.add_parser('server', help='HTTP服务器引擎负载测试')
+    server_parser.add_argument('--clients', type=int, default=50)
+    server_parser.add_argument('--requests', type=int, default=2000)
+    server_parser.add_argument('--workers', type=int, default=16)
+    server_parser.add_argument('--keep-alive', action='store_true',
+                               help='每个客户端复用HTTP/1.1长连接')
+    server_parser.add_argument('--path', default='/api/history', help='请求的路径，例如 / 测试手机页面')
+    server_parser.add_argument('--gzip', action='store_true', help='请求时带 Accept-Encoding: gzip')
+    server_parser.set_defaults(func=bench_server)
+
+    history_parser = subparsers.add_parser('history', help='历史记录插入开销')
+    history_parser.add_argument('--sizes', default='100,1000,10000,50000')
+    history_parser.add_argument('--item-size', type=int, default=1024)
+    history_parser.add_argument('--inserts', type=int, default=200)
+    history_parser.add_argument('--legacy-max', type=int, default=10000,
+                                help='旧算法只测到该历史长度（太慢）')
+    history_parser.set_defaults(func=bench_history)
+
+    save_parser = subparsers.add_parser('save', help='历史文件写入开销')
+    save_parser.add_argument('--records', type=int, default=2000)
+    save_parser.add_argument('--item-size', type=int, default=200)
+    save_parser.add_argument('--fsync', choices=app.HistoryWriter.FSYNC_POLICIES, default='never',
+                             help='batch/close 时旧方式每条都同步到磁盘')
+    save_parser.add_argument('--dir', help='写入目录（例如网络挂载的目录），默认临时目录')
+    save_parser.set_defaults(func=bench_save)
+
+    search_parser = subparsers.add_parser('search', help='全文搜索延迟')
+    search_parser.add_argument('--entries', type=int, default=20000)
+    search_parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory')
+    search_parser.add_argument('--repeat', type=int, default=5)
+    search_parser.set_defaults(func=bench_search)
+
+    polling_parser = subparsers.add_parser('polling', help='剪贴板检测的唤醒次数和延迟')
+    polling_parser.add_argument('--duration', type=float, default=60)
+    polling_parser.add_argument('--interval', type=float, default=1.0, help='固定轮询间隔')
+    polling_parser.add_argument('--min-interval', type=float, default=0.2)
+    polling_parser.add_argument('--max-interval', type=float, default=3.0, help='自适应轮询空闲时的最长间隔')
+    polling_parser.set_defaults(func=bench_polling)
+
+    detect_parser = subparsers.add_parser('detect', help='剪贴板变化检测开销')
+    detect_parser.add_argument('--sizes', default='1,100,1000,10000', help='内容大小(KB)')
+    detect_parser.add_argument('--ticks', type=int, default=50)
+    detect_parser.set_defaults(func=bench_detect)
+
+    startup_parser = subparsers.add_parser('startup', help='无界面模式的启动时间和内存')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.set_defaults(func=bench_startup)
+
+    imports_parser = subparsers.add_parser('imports', help='模块导入耗时和预算检查')
+    imports_parser.add_argument('--runs', type=int, default=5)
+    imports_parser.add_argument('--top', type=int, default=10, help='显示最慢的几个直接依赖')
+    imports_parser.add_argument('--budget-ms', type=float, default=120,
+                                help='导入耗时预算，超出时退出码为1')
+    imports_parser.set_defaults(func=bench_imports)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,29 +5,2050 @@
 功能：自动获取剪贴板内容并保存，支持iOS手机通过二维码接收
 """
 
-import tkinter as tk
-from tkinter import messagebox, scrolledtext, ttk, filedialog
-import pyperclip
-import qrcode
+import argparse
+import base64
+import ctypes
+import gzip
+import hashlib
+import heapq
+import importlib.util
 import json
 import logging
+import math
+import os
+import queue
+import re
+import select
+import selectors
+import shutil
+import signal
 import time
 import threading
 import socket
+import sqlite3
+import struct
+import sys
+import zlib
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from io import BytesIO
-from PIL import Image, ImageTk
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('clipboard_monitor.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from urllib.parse import urlparse, parse_qs
+
+# brotli 为可选依赖：安装后手机页面额外提供 br 压缩版本
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 界面模块在创建界面时才导入（见 import_gui_modules），无界面模式不加载
+tk = ttk = messagebox = ImageTk = None
+
+
+def import_gui_modules():
+    """导入界面用到的 tkinter 和 PIL.ImageTk"""
+    global tk, ttk, messagebox, ImageTk
+    import tkinter as tk
+    from tkinter import messagebox, ttk
+    from PIL import ImageTk
+
+
+# 可选的HTTP服务器引擎（config.json 中的 server_engine）
+SERVER_ENGINES = ('threading', 'asyncio', 'single')
+
+# /api/history 分页时单页最多返回的条数
+HISTORY_PAGE_MAX = 500
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """线程池HTTP服务器：连接交给有界线程池处理，慢客户端不会阻塞其他请求
+
+    长连接处理完一个请求后如果没有下一个请求，交给一个 selector 线程等待，
+    工作线程立即返回线程池；连接上有数据时再提交给线程池，空闲超过
+    idle_timeout 则关闭。
+    """
+
+    # 默认的listen队列只有5，并发连接较多时客户端会因SYN重传多等1秒
+    request_queue_size = 128
+
+    def __init__(self, server_address, RequestHandlerClass, max_workers=16, idle_timeout=15):
+        # 绑定端口失败时基类会调用 server_close()，线程池要先创建
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='http-worker')
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        self.keep_alive_idle_timeout = idle_timeout
+        # 等待下一个请求的连接 -> (客户端地址, 已处理的请求数, 截止时间)；
+        # 超时时间相同，按加入顺序就是按截止时间排序
+        self._idle = {}
+        # 处理器标记要交出的连接，工作线程返回后移入 _parking，
+        # 再由 selector 线程注册（selector 不是线程安全的）
+        self._parked = {}
+        self._parking = {}
+        self._resumed = {}
+        self._idle_lock = threading.Lock()
+        self._idle_closed = False
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._idle_thread = None
+        super().__init__(server_address, RequestHandlerClass)
+        self._idle_thread = threading.Thread(target=self._watch_idle, name='http-idle',
+                                             daemon=True)
+        self._idle_thread.start()
+
+    def process_request(self, request, client_address):
+        """把连接提交到线程池，立即返回继续accept"""
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """在工作线程中处理单个连接"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._detached_lock:
+                detached = request in self._detached
+            with self._idle_lock:
+                parked = self._parked.pop(request, None)
+                if parked is not None and not self._idle_closed:
+                    self._parking[request] = parked
+                else:
+                    parked = None
+            if parked is not None:
+                self._wakeup()
+            elif not detached:
+                self.shutdown_request(request)
+
+    def detach_request(self, request):
+        """连接转交给专用线程（事件推送），工作线程返回后不关闭它"""
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def release_request(self, request):
+        """专用线程结束后关闭转交出去的连接"""
+        with self._detached_lock:
+            self._detached.discard(request)
+        self.shutdown_request(request)
+
+    def park_request(self, request, client_address, requests_served):
+        """长连接暂时没有请求：工作线程返回后交给 selector 线程等待"""
+        with self._idle_lock:
+            self._parked[request] = (client_address, requests_served)
+
+    def requests_served(self, request):
+        """连接重新提交给线程池前已处理的请求数"""
+        with self._idle_lock:
+            return self._resumed.pop(request, 0)
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
+    def _watch_idle(self):
+        """等待空闲连接上的下一个请求，有数据时提交给线程池，超时则关闭"""
+        while True:
+            with self._idle_lock:
+                if self._idle_closed:
+                    break
+                parking, self._parking = self._parking, {}
+            deadline = time.monotonic() + self.keep_alive_idle_timeout
+            for request, (client_address, served) in parking.items():
+                try:
+                    self._selector.register(request, selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    self.shutdown_request(request)
+                    continue
+                self._idle[request] = (client_address, served, deadline)
+            timeout = None
+            if self._idle:
+                timeout = max(next(iter(self._idle.values()))[2] - time.monotonic(), 0)
+            for key, _ in self._selector.select(timeout):
+                request = key.fileobj
+                if request is self._wakeup_r:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                self._selector.unregister(request)
+                client_address, served, _ = self._idle.pop(request)
+                with self._idle_lock:
+                    self._resumed[request] = served
+                try:
+                    self.executor.submit(self.process_request_thread, request, client_address)
+                except RuntimeError:
+                    # 线程池已关闭
+                    self.shutdown_request(request)
+            now = time.monotonic()
+            while self._idle:
+                request, (_, _, deadline) = next(iter(self._idle.items()))
+                if deadline > now:
+                    break
+                del self._idle[request]
+                self._selector.unregister(request)
+                self.shutdown_request(request)
+        for request in self._idle:
+            self.shutdown_request(request)
+        self._idle.clear()
+        self._selector.close()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+        with self._idle_lock:
+            self._idle_closed = True
+            parking, self._parking = self._parking, {}
+        self._wakeup()
+        if self._idle_thread is not None:
+            self._idle_thread.join()
+        else:
+            self._selector.close()
+        for request in parking:
+            self.shutdown_request(request)
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+
+class _AsyncioRequestFile:
+    """处理器的rfile：先读事件循环已缓冲的请求，之后的数据从连接上阻塞读取"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+
+    def readline(self, limit=-1):
+        data = self.connection.buffered.readline(limit)
+        if not data:
+            # 缓冲的请求已处理完，处理器想继续读下一个请求：交回事件循环等待
+            self.connection.keep_alive = True
+        return data
+
+    def read(self, size=-1):
+        data = self.connection.buffered.read(size)
+        if size is None or size < 0 or len(data) >= size:
+            return data
+        return data + self.connection.receive(size - len(data))
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncioConnection:
+    """交给BaseHTTPRequestHandler的类socket对象，实际读写由事件循环完成"""
+
+    write_timeout = 30
+
+    def __init__(self, loop, reader, writer, buffered, requests_served=0):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.buffered = BytesIO(buffered)
+        self.requests_served = requests_served
+        self.keep_alive = False
+        # 转交给专用线程时设置，线程结束后完成
+        self.stream = None
+
+    def makefile(self, mode='rb', buffering=None):
+        return _AsyncioRequestFile(self)
+
+    def receive(self, size):
+        """从连接上再读取size字节（WebSocket等长连接使用）"""
+        import asyncio
+        
+        async def read_exactly():
+            try:
+                return await self.reader.readexactly(size)
+            except asyncio.IncompleteReadError as e:
+                return e.partial
+        return asyncio.run_coroutine_threadsafe(read_exactly(), self.loop).result()
+
+    def sendall(self, data):
+        import asyncio
+        
+        async def write():
+            self.writer.write(data)
+            await self.writer.drain()
+        data = bytes(data)
+        asyncio.run_coroutine_threadsafe(write(), self.loop).result(self.write_timeout)
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+    def shutdown(self, how):
+        """关闭连接，唤醒阻塞在 receive 上的工作线程"""
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    def fileno(self):
+        return self.writer.get_extra_info('socket').fileno()
+
+
+class AsyncioHTTPServer:
+    """基于asyncio的HTTP服务器：事件循环负责accept和读取请求，处理器在有界线程池中执行
+
+    空闲连接和缓慢上传只占用事件循环，不占用工作线程。asyncio 导入较慢，
+    只在使用这个引擎时才导入。
+    """
+
+    def __init__(self, server_address, RequestHandlerClass, max_workers=16, idle_timeout=None):
+        import asyncio
+        self.RequestHandlerClass = RequestHandlerClass
+        self.idle_timeout = idle_timeout
+        self.socket = socket.create_server(server_address)
+        self.server_address = self.socket.getsockname()[:2]
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='http-worker')
+        self.loop = asyncio.new_event_loop()
+        self._shutdown_request = False
+        self._is_shut_down = threading.Event()
+
+    def serve_forever(self):
+        """运行事件循环直到 shutdown() 被调用"""
+        import asyncio
+        self._is_shut_down.clear()
+        asyncio.set_event_loop(self.loop)
+        try:
+            if self._shutdown_request:
+                return
+            server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, sock=self.socket))
+            self.loop.run_forever()
+            server.close()
+            # 取消仍在进行的连接任务，避免事件循环关闭时遗留挂起的协程
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            self._is_shut_down.set()
+
+    def shutdown(self):
+        """停止事件循环并等待 serve_forever 返回"""
+        self._shutdown_request = True
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._is_shut_down.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.executor.shutdown(wait=False)
+        if not self.loop.is_running():
+            self.loop.close()
+
+    async def _handle_connection(self, reader, writer):
+        """读取完整请求后交给线程池处理"""
+        import asyncio
+        client_address = writer.get_extra_info('peername')
+        requests_served = 0
+        try:
+            while True:
+                try:
+                    # 长连接空闲超过 idle_timeout 则关闭
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.idle_timeout)
+                    length = self._content_length(head)
+                    body = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError, ConnectionError):
+                    break
+                connection = _AsyncioConnection(self.loop, reader, writer, head + body,
+                                                requests_served)
+                await self.loop.run_in_executor(self.executor, self._dispatch,
+                                                connection, client_address)
+                requests_served += 1
+                if connection.stream is not None:
+                    # 推送连接在专用线程中继续运行，结束后再关闭
+                    await asyncio.wrap_future(connection.stream)
+                    break
+                if not connection.keep_alive:
+                    break
+        except asyncio.CancelledError:
+            # 服务器关闭时被取消，正常返回以免 start_server 的回调记录错误
+            pass
+        finally:
+            writer.close()
+
+    def detach_request(self, connection):
+        """连接转交给专用线程（事件推送），不再占用工作线程"""
+        connection.stream = Future()
+
+    def release_request(self, connection):
+        connection.stream.set_result(None)
+
+    def _dispatch(self, connection, client_address):
+        try:
+            self.RequestHandlerClass(connection, client_address, self)
+        except Exception as e:
+            logging.error(f"处理请求失败 {client_address}: {e}")
+
+    @staticmethod
+    def _content_length(head):
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                try:
+                    return max(int(value.strip()), 0)
+                except ValueError:
+                    return 0
+        return 0
+
+
+class EventBroadcaster:
+    """事件广播器：每个订阅者一个有界队列，慢客户端只影响自己"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # 订阅者数量变化时调用 on_subscribers_changed(数量)
+        self.on_subscribers_changed = None
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, limit=None):
+        """注册订阅者，返回其事件队列；已有 limit 个订阅者时返回None
+
+        上限检查和注册在同一把锁内，同时连接的客户端不会超过上限。
+        """
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(subscriber)
+            count = len(self._subscribers)
+        self._subscribers_changed(count)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+            count = len(self._subscribers)
+        self._subscribers_changed(count)
+
+    def _subscribers_changed(self, count):
+        if self.on_subscribers_changed is not None:
+            self.on_subscribers_changed(count)
+
+    def publish(self, event, data=None):
+        """向所有订阅者发送事件，不会阻塞发布者"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                # 队列已满说明客户端跟不上：丢弃积压，让它重新拉取完整历史
+                self._drain(subscriber)
+                self._put(subscriber, ('reset', None))
+
+    def close(self):
+        """通知所有订阅者结束"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._drain(subscriber)
+            self._put(subscriber, None)
+
+    @staticmethod
+    def _put(subscriber, message):
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            pass
+
+    @staticmethod
+    def _drain(subscriber):
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class GUIEventBus:
+    """把监控线程和服务器线程的事件交给Tk线程
+
+    post() 可在任何线程调用，只在锁内记一笔；Tk线程每一帧调用一次 drain()
+    取出这段时间的全部事件。同类事件合并：新记录按顺序累积，其他事件只保留
+    最后一次的数据，所以突发的大量事件每帧最多引起一次重绘。
+    """
+
+    def __init__(self, max_items=None):
+        # 一帧内新记录超过这么多条时改为整体重新加载
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = []
+        self._events = {}
+        self.posted = 0
+        self.batches = 0
+
+    def post(self, event, data=None):
+        with self._lock:
+            self.posted += 1
+            if event == 'history':
+                self._items.append(data)
+                if self.max_items is not None and len(self._items) > self.max_items:
+                    self._items.clear()
+                    self._events['reset'] = None
+            else:
+                if event == 'reset':
+                    self._items.clear()
+                self._events[event] = data
+
+    def drain(self):
+        """取出积累的事件：(新记录列表（从旧到新）, {事件: 最后的数据})；没有事件时返回None"""
+        # 空闲时不加锁，每帧的检查只有两次属性读取
+        if not self._items and not self._events:
+            return None
+        with self._lock:
+            items, self._items = self._items, []
+            events, self._events = self._events, {}
+            self.batches += 1
+        return items, events
+
+
+class WebSocketConnection:
+    """最小的WebSocket（RFC 6455）实现，只依赖标准库"""
+
+    GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+    OP_CONTINUATION = 0x0
+    OP_TEXT = 0x1
+    OP_BINARY = 0x2
+    OP_CLOSE = 0x8
+    OP_PING = 0x9
+    OP_PONG = 0xA
+
+    # 单条消息的最大长度，防止恶意客户端耗尽内存
+    max_message_size = 1024 * 1024
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def accept_key(cls, key):
+        """根据 Sec-WebSocket-Key 计算握手响应"""
+        digest = hashlib.sha1((key + cls.GUID).encode('ascii')).digest()
+        return base64.b64encode(digest).decode('ascii')
+
+    def send_frame(self, opcode, payload=b''):
+        """发送单个完整帧（服务器发出的帧不加掩码）"""
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        with self._write_lock:
+            self.wfile.write(header + payload)
+
+    def send_json(self, data):
+        self.send_frame(self.OP_TEXT, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    def close(self, code=1000):
+        """发送关闭帧（只发送一次）"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.send_frame(self.OP_CLOSE, struct.pack('!H', code))
+        except OSError:
+            pass
+
+    def _read_exactly(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError('WebSocket连接已断开')
+        return data
+
+    def read_frame(self):
+        """读取一帧，返回 (fin, opcode, payload)"""
+        first, second = self._read_exactly(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._read_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._read_exactly(8))[0]
+        if length > self.max_message_size:
+            raise ValueError('WebSocket消息过大')
+
+        mask = self._read_exactly(4) if second & 0x80 else None
+        payload = self._read_exactly(length)
+        if mask and length:
+            # 整块异或比逐字节循环快得多
+            key = int.from_bytes((mask * (length // 4 + 1))[:length], 'big')
+            payload = (int.from_bytes(payload, 'big') ^ key).to_bytes(length, 'big')
+        self.last_seen = time.monotonic()
+        return fin, opcode, payload
+
+    def receive(self):
+        """读取一条完整消息，返回 (opcode, payload)；连接关闭时返回None
+
+        ping/pong等控制帧在这里处理，分片消息会被拼接。
+        """
+        message_opcode = None
+        fragments = []
+        while True:
+            fin, opcode, payload = self.read_frame()
+            if opcode == self.OP_PING:
+                self.send_frame(self.OP_PONG, payload)
+                continue
+            if opcode == self.OP_PONG:
+                continue
+            if opcode == self.OP_CLOSE:
+                self.close()
+                return None
+
+            if opcode != self.OP_CONTINUATION:
+                message_opcode = opcode
+                fragments = []
+            fragments.append(payload)
+            if sum(len(f) for f in fragments) > self.max_message_size:
+                raise ValueError('WebSocket消息过大')
+            if fin:
+                return message_opcode, b''.join(fragments)
+
+
+def accepted_encodings(header):
+    """解析 Accept-Encoding，返回客户端接受的编码集合（q=0 的除外）"""
+    encodings = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+class PrecompressedBody:
+    """预先压缩好的响应正文：原文、gzip 以及（安装了 brotli 时）br 版本
+
+    每个版本有自己的 ETag，按请求的 Accept-Encoding 选择。
+    """
+
+    # 优先级从高到低
+    ENCODINGS = ('br', 'gzip')
+
+    def __init__(self, body, content_type, compress=True):
+        self.content_type = content_type
+        self.etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.variants = {'identity': body}
+        # PNG 等已压缩的格式再压缩没有收益
+        if compress:
+            self.variants['gzip'] = gzip.compress(body, 9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body)
+
+    def select(self, accept_encoding):
+        """返回 (编码, 正文, ETag)"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in self.ENCODINGS:
+            if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                return encoding, self.variants[encoding], f'"{self.etag}-{encoding}"'
+        return 'identity', self.variants['identity'], f'"{self.etag}"'
+
+
+class StreamingResponse:
+    """边生成边发送的响应正文
+
+    正文先缓存在内存中：结束时不超过缓存上限的响应和普通响应一样带
+    Content-Length 一次发送；超过上限后改用分块传输，之后每攒够 CHUNK_SIZE
+    字节发送一块，内存占用与响应大小无关。客户端支持时用 gzip/deflate
+    压缩，小于 min_size 的响应不压缩。HTTP/1.0 客户端不支持分块，正文
+    压缩后整体缓存，结束时带 Content-Length 发送。
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    # 字符串先攒到这么长再编码，避免逐个小片段编码
+    TEXT_BATCH = 8 * 1024
+    # gzip 优先；HTTP 的 deflate 是 zlib 格式
+    WBITS = {'gzip': 31, 'deflate': 15}
+
+    def __init__(self, handler, content_type, status=200, headers=None, encoding=None,
+                 min_size=1024):
+        self.handler = handler
+        self.content_type = content_type
+        self.status = status
+        self.headers = dict(headers or {})
+        self.encoding = encoding
+        self._text = []
+        self._text_size = 0
+        self._buffer = []
+        self._size = 0
+        self._compressor = None
+        self._chunked = False
+        # 压缩时超过 min_size 就开始压缩：HTTP/1.1 改用分块发送，HTTP/1.0 继续缓存
+        self._buffered = handler.request_version != 'HTTP/1.1'
+        if encoding:
+            self._limit = min_size
+        else:
+            self._limit = float('inf') if self._buffered else self.CHUNK_SIZE
+
+    @classmethod
+    def negotiate(cls, accept_encoding):
+        """按 Accept-Encoding 选择压缩方式，不支持时返回None"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in cls.WBITS:
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def write(self, text):
+        self._text.append(text)
+        self._text_size += len(text)
+        if self._text_size >= self.TEXT_BATCH:
+            self._push_text()
+
+    def write_json(self, data):
+        for part in json.JSONEncoder(ensure_ascii=False).iterencode(data):
+            self.write(part)
+
+    def _push_text(self):
+        data = ''.join(self._text).encode('utf-8')
+        self._text.clear()
+        self._text_size = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._buffer.append(data)
+        self._size += len(data)
+        if not self._chunked and self._size >= self._limit:
+            if self._buffered:
+                self._limit = float('inf')
+                self._start_compression()
+            else:
+                self._start_chunked()
+        elif self._chunked and self._size >= self.CHUNK_SIZE:
+            self._send_chunk()
+
+    def _start_chunked(self):
+        """发送响应头，改用分块传输"""
+        handler = self.handler
+        handler.send_response(self.status)
+        handler.send_header('Content-type', self.content_type)
+        handler.send_header('Transfer-Encoding', 'chunked')
+        if self.encoding is not None:
+            handler.send_header('Content-Encoding', self.encoding)
+        for name, value in self.headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        self._chunked = True
+        if self.encoding is not None:
+            self._start_compression()
+        if self._size >= self.CHUNK_SIZE:
+            self._send_chunk()
+
+    def _start_compression(self):
+        """压缩已缓存的正文，之后写入的内容边写边压缩"""
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, self.WBITS[self.encoding])
+        self._buffer = [self._compressor.compress(b''.join(self._buffer))]
+        self._size = len(self._buffer[0])
+
+    def _send_chunk(self):
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        if data:
+            self.handler.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def finish(self):
+        """发送剩余的正文"""
+        self._push_text()
+        if not self._chunked:
+            headers = self.headers
+            if self._compressor is not None:
+                self._buffer.append(self._compressor.flush())
+                headers = dict(headers, **{'Content-Encoding': self.encoding})
+            self.handler.send_body(b''.join(self._buffer), self.content_type, self.status,
+                                   headers)
+            return
+        if self._compressor is not None:
+            self._buffer.append(self._compressor.flush())
+        self._send_chunk()
+        self.handler.wfile.write(b'0\r\n\r\n')
+
+
+class HistorySnapshot:
+    """历史记录在某一时刻的只读视图，从新到旧迭代
+
+    快照引用 HistoryStore 的追加日志中 [start, end) 这一段，跳过其中被
+    移到最前的旧记录（dead）。日志只追加不修改，所以快照创建后内容不变。
+    """
+    __slots__ = ('_log', '_start', '_end', '_dead', '_count', 'last_id')
+
+    def __init__(self, log=(), start=0, end=0, dead=frozenset(), count=0, last_id=0):
+        self._log = log
+        self._start = start
+        self._end = end
+        self._dead = dead
+        self._count = count
+        self.last_id = last_id
+
+    def __iter__(self):
+        log, dead = self._log, self._dead
+        for index in range(self._end - 1, self._start - 1, -1):
+            item = log[index]
+            if item['id'] not in dead:
+                yield item
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def oldest_id(self):
+        """快照中最旧记录的 id，没有记录时为 last_id + 1"""
+        for index in range(self._start, self._end):
+            item = self._log[index]
+            if item['id'] not in self._dead:
+                return item['id']
+        return self.last_id + 1
+
+
+class SearchIndex:
+    """历史记录的内存倒排索引
+
+    英文和数字按单词切分，中文按单字和相邻两字切分。查询时对所有词的
+    记录集合取交集，按 BM25 打分排序，不需要扫描全部记录。
+    """
+
+    # 每条记录只索引前这么多字符
+    MAX_CHARS = 20000
+    _TOKEN_RE = re.compile(r'[0-9a-z_]+|[\u3400-\u9fff\uf900-\ufaff]+')
+
+    def __init__(self):
+        self._postings = {}  # 词 -> {id: 词频}
+        self._lengths = {}   # id -> 词数
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def terms(cls, text, query=False):
+        """把文本切分为索引词；query为True时中文只取两字词（单字除外）"""
+        terms = []
+        for token in cls._TOKEN_RE.findall(text[:cls.MAX_CHARS].lower()):
+            if token.isascii() or len(token) == 1:
+                terms.append(token)
+                continue
+            if not query:
+                terms.extend(token)
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+        return terms
+
+    @classmethod
+    def query_terms(cls, query):
+        """查询中不重复的词，保持原顺序"""
+        return list(dict.fromkeys(cls.terms(query, query=True)))
+
+    def add(self, item_id, terms):
+        with self._lock:
+            self._lengths[item_id] = len(terms)
+            self._total_length += len(terms)
+            for term, count in Counter(terms).items():
+                self._postings.setdefault(term, {})[item_id] = count
+
+    def remove(self, item_id, content):
+        with self._lock:
+            self._total_length -= self._lengths.pop(item_id, 0)
+            for term in set(self.terms(content)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(item_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._total_length = 0
+
+    def search(self, query, limit=50):
+        """返回按相关度排序的记录id"""
+        terms = self.query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            matches = []
+            for i, term in enumerate(terms):
+                postings = self._postings.get(term)
+                if i == len(terms) - 1 and term.isascii():
+                    # 最后一个英文词按前缀匹配，边输入边搜索；完全匹配的词频加倍
+                    postings = dict(postings or {})
+                    for key, ids in self._postings.items():
+                        if key.startswith(term) and key.isascii():
+                            for item_id, count in ids.items():
+                                postings[item_id] = postings.get(item_id, 0) + count
+                if not postings:
+                    return []
+                matches.append(postings)
+            
+            matches.sort(key=len)
+            candidates = set(matches[0]).intersection(*matches[1:])
+            total = len(self._lengths)
+            average = self._total_length / total if total else 1
+            scores = dict.fromkeys(candidates, 0.0)
+            norms = {item_id: 1.2 * (0.25 + 0.75 * self._lengths[item_id] / average)
+                     for item_id in candidates}
+            for postings in matches:
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for item_id in candidates:
+                    tf = postings[item_id]
+                    scores[item_id] += idf * tf * 2.2 / (tf + norms[item_id])
+        # 分数相同时新记录在前
+        return heapq.nlargest(limit, scores, key=lambda item_id: (scores[item_id], item_id))
+
+    @classmethod
+    def fts_query(cls, query):
+        """转换为 SQLite FTS5 查询语法，无有效词时返回None"""
+        terms = cls.query_terms(query)
+        if not terms:
+            return None
+        phrases = ['"' + term.replace('"', '""') + '"' for term in terms]
+        if terms[-1].isascii():
+            # 与内存索引一致：前缀匹配，完全匹配的排在前面
+            phrases[-1] = f'({phrases[-1]} OR {phrases[-1]}*)'
+        return ' AND '.join(phrases)
+
+
+class HistoryDatabase:
+    """SQLite 历史记录存储（WAL模式），重启后历史记录仍在
+
+    内存中只保留最新的 max_history 条，更早的记录按需从数据库读取。
+    retention 为数据库最多保留的条数（0 表示不限制）。
+    """
+
+    # 超出 retention 这么多条后才批量删除旧记录
+    TRIM_BATCH = 64
+
+    def __init__(self, path, retention=0):
+        self.path = path
+        self.retention = retention
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hash BLOB NOT NULL,
+                    type TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_history_hash ON history(hash);
+                CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+            """)
+            self._count = self._conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+            self.fts = self._create_fts()
+        logging.info(f"历史数据库 {path} 已打开，共 {self._count} 条记录")
+
+    def _create_fts(self):
+        """创建全文索引表（保存 SearchIndex 切分后的词），不支持FTS5时返回False"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+        if exists:
+            return True
+        try:
+            with self._conn:
+                self._conn.execute('CREATE VIRTUAL TABLE history_fts USING fts5(terms)')
+                # 为已有记录建立索引
+                self._conn.create_function('search_terms', 1,
+                                           lambda content: ' '.join(SearchIndex.terms(content)))
+                self._conn.execute(
+                    'INSERT INTO history_fts (rowid, terms) SELECT id, search_terms(content) FROM history')
+            return True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite不支持FTS5，搜索只覆盖内存中的记录: {e}")
+            return False
+
+    @staticmethod
+    def _row_to_item(row):
+        return {'id': row[0], 'type': row[1], 'content': row[2], 'timestamp': row[3]}
+
+    @property
+    def last_id(self):
+        """分配过的最大 id（清空后也不会重复使用）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'history'").fetchone()
+        return row[0] if row else 0
+
+    @property
+    def oldest_id(self):
+        """数据库中最旧记录的 id，没有记录时为None"""
+        with self._lock:
+            row = self._conn.execute('SELECT MIN(id) FROM history').fetchone()
+        return row[0]
+
+    def recent(self, limit):
+        """最新的limit条记录，返回 [(hash, item)]，从旧到新"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, type, content, timestamp, hash FROM history ORDER BY id DESC LIMIT ?',
+                (limit,)).fetchall()
+        return [(bytes(row[4]), self._row_to_item(row)) for row in reversed(rows)]
+
+    def older(self, before, limit):
+        """id小于before的记录，从新到旧最多limit条"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, type, content, timestamp FROM history WHERE id < ? ORDER BY id DESC LIMIT ?',
+                (before, limit)).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, type, content, timestamp FROM history WHERE id = ?', (item_id,)).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def find(self, key):
+        """按内容哈希查找最新的一条记录（走 idx_history_hash 索引）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, type, content, timestamp FROM history WHERE hash = ? '
+                'ORDER BY id DESC LIMIT 1', (key,)).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def insert(self, key, item, replaced_id=None, terms=()):
+        """写入新记录；replaced_id 为被移到最前的旧记录，terms 为全文索引词
+
+        返回超出 retention 被删除、且不再被其他记录引用的图片记录。
+        """
+        removed = []
+        try:
+            with self._lock, self._conn:
+                if replaced_id is not None:
+                    self._delete_through(replaced_id, replaced_id)
+                self._conn.execute(
+                    'INSERT INTO history (id, hash, type, content, timestamp) VALUES (?, ?, ?, ?, ?)',
+                    (item['id'], key, item['type'], item['content'], item['timestamp']))
+                if self.fts:
+                    self._conn.execute('INSERT INTO history_fts (rowid, terms) VALUES (?, ?)',
+                                       (item['id'], ' '.join(terms)))
+                self._count += 1
+                if self.retention and self._count > self.retention + self.TRIM_BATCH:
+                    cutoff = self._conn.execute(
+                        'SELECT id FROM history ORDER BY id LIMIT 1 OFFSET ?',
+                        (self._count - self.retention - 1,)).fetchone()[0]
+                    images = self._conn.execute(
+                        "SELECT id, type, content, timestamp FROM history "
+                        "WHERE type = 'image' AND id <= ?", (cutoff,)).fetchall()
+                    self._delete_through(0, cutoff)
+                    # 同一张图片可能在更新的记录中再次出现
+                    removed = [self._row_to_item(row) for row in images
+                               if not self._conn.execute(
+                                   "SELECT 1 FROM history WHERE type = 'image' AND content = ? LIMIT 1",
+                                   (row[2],)).fetchone()]
+        except sqlite3.Error as e:
+            # 数据库写入失败不影响内存中的历史记录
+            logging.error(f"历史记录写入数据库失败: {e}")
+        return removed
+
+    def _delete_through(self, first_id, last_id):
+        """删除 id 在 [first_id, last_id] 内的记录（调用方持有 _lock）"""
+        if self.fts:
+            self._conn.execute('DELETE FROM history_fts WHERE rowid BETWEEN ? AND ?',
+                               (first_id, last_id))
+        self._count -= self._conn.execute('DELETE FROM history WHERE id BETWEEN ? AND ?',
+                                          (first_id, last_id)).rowcount
+
+    def search(self, query, limit=50):
+        """全文搜索，按 bm25 相关度排序"""
+        match = SearchIndex.fts_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT h.id, h.type, h.content, h.timestamp FROM history_fts f '
+                'JOIN history h ON h.id = f.rowid WHERE history_fts MATCH ? '
+                'ORDER BY f.rank LIMIT ?', (match, limit)).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def clear(self):
+        """删除全部记录，返回其中的图片记录"""
+        with self._lock, self._conn:
+            images = self._conn.execute(
+                "SELECT id, type, content, timestamp FROM history WHERE type = 'image'").fetchall()
+            self._conn.execute('DELETE FROM history')
+            if self.fts:
+                self._conn.execute('DELETE FROM history_fts')
+            self._count = 0
+        return [self._row_to_item(row) for row in images]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        return self._count
+
+
+class HistoryStore:
+    """剪贴板历史记录：按内容哈希索引，去重和插入都是O(1)
+
+    监控线程、HTTP线程和界面线程都会访问历史记录。写入在锁内进行，完成后
+    换上新的不可变快照；读取只取当前快照，不加锁也不会被写入阻塞。每条记录
+    带递增的 id，手机端据此增量同步。记录字典创建后不再修改。
+    """
+
+    def __init__(self, max_items=100, move_to_top=False, database=None):
+        self.max_items = max_items
+        # 重复复制已有内容时，是否把它移到最前面（否则忽略）
+        self.move_to_top = move_to_top
+        # 可选的 HistoryDatabase，内存之外的旧记录从这里读取
+        self.database = database
+        # 数据库支持全文索引时直接在数据库中搜索，否则用内存倒排索引
+        self.index = None if database is not None and database.fts else SearchIndex()
+        # 以下结构只在持有 _lock 时修改
+        self._items = OrderedDict()
+        self._by_id = {}
+        # 追加日志：按 id 从旧到新，_start 之前的已被截断，_dead 是被移走的记录
+        self._log = []
+        self._start = 0
+        self._dead = frozenset()
+        self._lock = threading.Lock()
+        self._snapshot = HistorySnapshot()
+        # 记录被永久删除（超出条数或清空）时调用 on_removed(记录列表)，用于清理图片文件
+        self.on_removed = None
+        
+        if database is not None:
+            # 启动时只加载最新的 max_items 条
+            for key, item in database.recent(max_items):
+                self._items[key] = item
+                self._by_id[item['id']] = item
+                self._log.append(item)
+                if self.index is not None:
+                    self.index.add(item['id'], SearchIndex.terms(item['content']))
+            with self._lock:
+                self._publish(database.last_id)
+
+    def snapshot(self):
+        """当前快照（不加锁）"""
+        return self._snapshot
+
+    @property
+    def last_id(self):
+        return self._snapshot.last_id
+
+    def _publish(self, last_id):
+        """换上新快照（调用方持有 _lock）"""
+        # 截断或移动积累过多时压缩日志，旧快照仍引用原来的列表
+        if self._start > max(64, len(self._items)) or len(self._dead) > max(64, len(self._items)):
+            self._log = list(self._items.values())
+            self._start = 0
+            self._dead = frozenset()
+        self._snapshot = HistorySnapshot(self._log, self._start, len(self._log),
+                                         self._dead, len(self._items), last_id)
+
+    @staticmethod
+    def content_hash(content, content_type='text'):
+        """记录的内容哈希（类型 + 内容）"""
+        digest = hashlib.blake2b(content_type.encode('utf-8'), digest_size=16)
+        digest.update(b'\0')
+        digest.update(content.encode('utf-8', 'surrogatepass'))
+        return digest.digest()
+
+    def add(self, content, content_type='text'):
+        """添加记录，返回新记录；重复内容被忽略时返回None"""
+        key = self.content_hash(content, content_type)
+        terms = SearchIndex.terms(content)
+        removed = []
+        with self._lock:
+            existing = self._items.get(key)
+            if existing is not None:
+                if not self.move_to_top:
+                    return None
+                # 移到最前：删除旧记录，作为新记录重新加入
+                del self._items[key]
+                del self._by_id[existing['id']]
+                self._dead = self._dead | {existing['id']}
+                if self.index is not None:
+                    self.index.remove(existing['id'], existing['content'])
+            elif self.database is not None:
+                # 内存之外的旧记录只在数据库中，同样按哈希去重
+                existing = self.database.find(key)
+                if existing is not None and not self.move_to_top:
+                    return None
+            
+            item = {
+                'id': self.last_id + 1,
+                'content': content,
+                'type': content_type,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            if self.database is not None:
+                removed = self.database.insert(key, item, existing and existing['id'], terms)
+            if self.index is not None:
+                self.index.add(item['id'], terms)
+            self._items[key] = item
+            self._by_id[item['id']] = item
+            self._log.append(item)
+            
+            # 限制历史记录数量
+            while len(self._items) > self.max_items:
+                _, oldest = self._items.popitem(last=False)
+                del self._by_id[oldest['id']]
+                if self.database is None:
+                    # 使用数据库时旧记录仍在数据库中
+                    removed.append(oldest)
+                if self.index is not None:
+                    self.index.remove(oldest['id'], oldest['content'])
+                # 日志开头的 dead 记录一并越过
+                while self._log[self._start] is not oldest:
+                    self._dead = self._dead - {self._log[self._start]['id']}
+                    self._start += 1
+                self._start += 1
+            
+            self._publish(item['id'])
+        self._removed(removed)
+        return item
+
+    def _removed(self, items):
+        if items and self.on_removed is not None:
+            self.on_removed(items)
+
+    def get(self, item_id):
+        """按 id 查找记录（单次字典读取是原子的，无需加锁）"""
+        item = self._by_id.get(item_id)
+        if item is None and self.database is not None:
+            item = self.database.get(item_id)
+        return item
+
+    def older(self, before, limit):
+        """内存之外、id小于before的旧记录（仅数据库后端）"""
+        if self.database is None:
+            return []
+        return self.database.older(before, limit)
+
+    def search(self, query, limit=50):
+        """全文搜索，返回按相关度排序的记录"""
+        if self.index is None:
+            return self.database.search(query, limit)
+        items = (self._by_id.get(item_id) for item_id in self.index.search(query, limit))
+        return [item for item in items if item is not None]
+
+    @property
+    def total(self):
+        """全部记录条数（包括只在数据库中的）"""
+        if self.database is not None:
+            return len(self.database)
+        return len(self._snapshot)
+
+    def close(self):
+        if self.database is not None:
+            self.database.close()
+
+    def clear(self):
+        with self._lock:
+            if self.database is not None:
+                removed = self.database.clear()
+            else:
+                removed = list(self._items.values())
+            if self.index is not None:
+                self.index.clear()
+            self._items.clear()
+            self._by_id.clear()
+            self._log = []
+            self._start = 0
+            self._dead = frozenset()
+            self._publish(self._snapshot.last_id)
+        self._removed(removed)
+
+    @property
+    def oldest_id(self):
+        """仍可读取的最旧记录的 id（包括只在数据库中的），没有记录时为 last_id + 1"""
+        if self.database is not None:
+            oldest = self.database.oldest_id
+            if oldest is not None:
+                return oldest
+        return self._snapshot.oldest_id
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __iter__(self):
+        """从新到旧迭代当前快照"""
+        return iter(self._snapshot)
+
+
+class HistoryWriter:
+    """历史记录文件的后台写入线程
+
+    save_to_file 只把格式化好的文本放进队列；写入线程攒够 batch_size 条或
+    距第一条待写记录超过 flush_interval 秒时，一次打开文件写入整批。
+    fsync 策略：never（交给操作系统）、batch（每批写完后同步到磁盘）、
+    close（只在关闭时同步）。
+    """
+
+    FSYNC_POLICIES = ('never', 'batch', 'close')
+
+    def __init__(self, flush_interval=1.0, batch_size=100, fsync='never'):
+        if fsync not in self.FSYNC_POLICIES:
+            logging.warning(f"未知的fsync策略 {fsync}，使用 never")
+            fsync = 'never'
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # fsync 为 close 时，上次同步后写过的文件（只在写入线程中访问）
+        self._unsynced = set()
+
+    def write(self, path, text):
+        """把text追加到path（异步）"""
+        with self._lock:
+            if self.flush_interval > 0 and not self._closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='HistoryWriter', daemon=True)
+                    self._thread.start()
+                self._queue.put((path, text))
+                return
+        # 未启用缓冲或已关闭：直接写入
+        self._write_batch(path, [text], self.fsync != 'never')
+
+    def close(self, timeout=5):
+        """写完剩余记录并停止写入线程（程序退出时调用）"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                message = False
+            
+            if isinstance(message, tuple):
+                pending.append(message)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(pending) < self.batch_size:
+                    continue
+            
+            # 超时、批次已满或关闭：写出全部待写记录
+            self._write_pending(pending, message is None)
+            pending = []
+            deadline = None
+            if message is None:
+                return
+
+    def _write_pending(self, pending, closing=False):
+        """按文件分组写入（保存路径可能在运行中被修改）"""
+        batches = OrderedDict()
+        for path, text in pending:
+            batches.setdefault(path, []).append(text)
+        for path, texts in batches.items():
+            self._write_batch(path, texts, self.fsync == 'batch')
+            if self.fsync == 'close':
+                self._unsynced.add(path)
+        if closing and self.fsync == 'close':
+            # 关闭时同步运行期间写过的所有文件，而不只是最后一批
+            for path in self._unsynced:
+                self._sync_file(path)
+            self._unsynced.clear()
+
+    @staticmethod
+    def _write_batch(path, texts, sync=False):
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(texts))
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            logging.info(f"已保存 {len(texts)} 条记录到 {path}")
+        except Exception as e:
+            logging.error(f"保存文件失败: {e}")
+
+    @staticmethod
+    def _sync_file(path):
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+        except OSError as e:
+            logging.error(f"同步文件失败 {path}: {e}")
+
+
+class ImageStore:
+    """剪贴板图片的内容寻址存储
+
+    原图按像素内容的哈希保存为 <哈希>.png，同一张图片再次复制时不会重复编码；
+    缩略图 <哈希>.thumb.jpg 由线程池在后台生成，每张图片只生成一次。文件先写入
+    临时文件再改名，存在的文件总是完整的。
+    """
+
+    HASH_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+    def __init__(self, directory='clipboard_images', thumbnail_size=256, workers=2):
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+        self.workers = workers
+        self._executor = None
+        self._pending = {}  # 哈希 -> 正在生成缩略图的 Future
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def image_hash(image):
+        """图片内容的哈希（模式、尺寸和像素）"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f'{image.mode} {image.width}x{image.height}\0'.encode('ascii'))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def image_signature(image, rows=16):
+        """只取少量像素行的快速签名，轮询时先用它判断图片是否没变，避免每次哈希全部像素"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f'{image.mode} {image.width}x{image.height}\0'.encode('ascii'))
+        rows = min(rows, image.height)
+        for i in range(rows):
+            y = i * image.height // rows
+            digest.update(image.crop((0, y, image.width, y + 1)).tobytes())
+        return digest.hexdigest()
+
+    def valid(self, key):
+        """key 是否为合法的哈希（也防止路径穿越）"""
+        return bool(key) and self.HASH_PATTERN.fullmatch(key) is not None
+
+    def image_path(self, key):
+        return os.path.join(self.directory, f'{key}.png')
+
+    def thumbnail_path(self, key):
+        return os.path.join(self.directory, f'{key}.thumb.jpg')
+
+    def save(self, image, key=None):
+        """保存图片并安排生成缩略图，返回哈希"""
+        key = key or self.image_hash(image)
+        path = self.image_path(key)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            image.save(temp_path, format='PNG')
+            os.replace(temp_path, path)
+        self.schedule_thumbnail(key, image)
+        return key
+
+    def schedule_thumbnail(self, key, image=None):
+        """提交缩略图任务；已存在时返回None，正在生成时返回已有的 Future"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None or os.path.exists(self.thumbnail_path(key)):
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='thumbnail')
+            future = self._executor.submit(self._make_thumbnail, key, image)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._finished(key))
+        return future
+
+    def _finished(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _make_thumbnail(self, key, image=None):
+        from PIL import Image
+        if image is None:
+            image = Image.open(self.image_path(key))
+        else:
+            # 调用方的图片不修改
+            image = image.copy()
+        image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        # JPEG 没有透明通道，透明部分铺白底
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        path = self.thumbnail_path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        image.save(temp_path, format='JPEG', quality=80, optimize=True)
+        os.replace(temp_path, path)
+        if not os.path.exists(self.image_path(key)):
+            # 生成期间原图已随历史记录删除
+            self._remove(path)
+
+    def delete(self, key):
+        """删除图片和缩略图（历史记录中已没有这张图片）"""
+        if self.valid(key):
+            self._remove(self.image_path(key))
+            self._remove(self.thumbnail_path(key))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"删除图片文件失败 {path}: {e}")
+
+    def thumbnail(self, key, timeout=10):
+        """缩略图路径：正在生成时等待完成，还没有时现在生成；原图不存在时返回None"""
+        path = self.thumbnail_path(key)
+        if os.path.exists(path):
+            return path
+        if not os.path.exists(self.image_path(key)):
+            return None
+        future = self.schedule_thumbnail(key)
+        try:
+            if future is not None:
+                future.result(timeout)
+        except Exception as e:
+            logging.error(f"生成缩略图失败 {key}: {e}")
+            return None
+        return path if os.path.exists(path) else None
+
+    def close(self):
+        """等待正在生成的缩略图完成"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+class AdaptivePollScheduler:
+    """自适应轮询间隔：检测到变化后回到最小间隔，空闲时按 backoff 倍数
+    逐步延长到最大间隔。同时统计检查次数、变化次数和估计的检测延迟。
+    """
+
+    def __init__(self, min_interval=0.2, max_interval=3.0, backoff=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.interval = min_interval
+        self.polls = 0
+        self.changes = 0
+        self._latency_total = 0.0
+        self._last_poll = None
+
+    def record(self, changed, now=None):
+        """记录一次检查的结果，更新下一次的间隔"""
+        now = time.monotonic() if now is None else now
+        self.polls += 1
+        if changed:
+            self.changes += 1
+            # 变化发生在两次检查之间，平均延迟约为间隔的一半
+            if self._last_poll is not None:
+                self._latency_total += (now - self._last_poll) / 2
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        self._last_poll = now
+        return self.interval
+
+    @property
+    def average_latency(self):
+        """估计的平均检测延迟（秒）"""
+        return self._latency_total / self.changes if self.changes else 0.0
+
+    def stats(self):
+        return {
+            'polls': self.polls,
+            'changes': self.changes,
+            'average_latency': self.average_latency,
+            'interval': self.interval
+        }
+
+
+def platform_change_counter():
+    """系统剪贴板的变化计数函数：Windows 为剪贴板序列号，macOS 为
+    NSPasteboard.changeCount。计数不变说明剪贴板没有变化，无需读取内容。
+    其他平台返回None。
+    """
+    try:
+        if sys.platform == 'win32':
+            return ctypes.windll.user32.GetClipboardSequenceNumber
+        if sys.platform == 'darwin':
+            from ctypes.util import find_library
+            objc = ctypes.cdll.LoadLibrary(find_library('objc'))
+            ctypes.cdll.LoadLibrary(find_library('AppKit'))
+            objc.objc_getClass.restype = ctypes.c_void_p
+            objc.objc_getClass.argtypes = [ctypes.c_char_p]
+            objc.sel_registerName.restype = ctypes.c_void_p
+            objc.sel_registerName.argtypes = [ctypes.c_char_p]
+            send = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p)(
+                ('objc_msgSend', objc))
+            send_long = ctypes.CFUNCTYPE(ctypes.c_long, ctypes.c_void_p, ctypes.c_void_p)(
+                ('objc_msgSend', objc))
+            pasteboard = send(objc.objc_getClass(b'NSPasteboard'),
+                              objc.sel_registerName(b'generalPasteboard'))
+            change_count = objc.sel_registerName(b'changeCount')
+            return lambda: send_long(pasteboard, change_count)
+    except (AttributeError, OSError, TypeError) as e:
+        logging.info(f"无法读取剪贴板变化计数: {e}")
+    return None
+
+
+class ClipboardBackend:
+    """剪贴板读写和变化检测后端（基类为 pyperclip 定时轮询）
+
+    monitor_loop 每次检查剪贴板后调用 wait()，返回时剪贴板可能已经变化。
+    事件驱动的子类在收到系统通知时调用 notify() 唤醒监控线程；如果后台
+    监听意外退出，设置 failed，监控线程会改用轮询。
+    """
+
+    name = 'polling'
+    event_driven = False
+    # 事件驱动后端的兜底检查间隔（秒），防止漏掉通知
+    fallback_interval = 30.0
+
+    def __init__(self):
+        self.failed = False
+        self._event = threading.Event()
+        self._change_counter = None
+
+    def start(self):
+        """开始监听，不可用时返回False"""
+        self._event.clear()
+        if self._change_counter is None:
+            self._change_counter = platform_change_counter() or False
+        return True
+
+    def change_count(self):
+        """剪贴板变化计数，平台不支持时返回None"""
+        return self._change_counter() if self._change_counter else None
+
+    def stop(self):
+        """停止监听并唤醒正在等待的监控线程"""
+        self._event.set()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, interval):
+        """等待下一次检查时机：轮询后端等待interval秒，事件驱动后端等待通知"""
+        self._event.wait(self.fallback_interval if self.event_driven else interval)
+        self._event.clear()
+
+    # pyperclip 导入时会探测剪贴板工具，第一次读写时才导入
+    def paste(self):
+        import pyperclip
+        return pyperclip.paste()
+
+    def copy(self, content):
+        import pyperclip
+        pyperclip.copy(content)
+
+    @staticmethod
+    def is_unavailable_error(error):
+        """error 是否表示系统上没有可用的剪贴板（如 Linux 上没有 xclip、xsel 或 wl-clipboard）"""
+        import pyperclip
+        return isinstance(error, pyperclip.PyperclipException)
+
+    def grab_image(self):
+        """读取剪贴板中的图片（PIL.Image），没有图片时返回None
+
+        平台不支持时抛出 NotImplementedError（Linux 上需要 xclip 或 wl-paste）。
+        """
+        from PIL import ImageGrab
+        image = ImageGrab.grabclipboard()
+        # 复制的是文件时返回文件名列表，这里只记录图片
+        return image if hasattr(image, 'tobytes') else None
+
+
+class FakeClipboardBackend(ClipboardBackend):
+    """内存中的假剪贴板，用于测试和基准测试：copy() 立即通知监控线程（轮询模式下不通知）"""
+
+    name = 'fake'
+    event_driven = True
+
+    def __init__(self, content='', event_driven=True, change_counter=True):
+        super().__init__()
+        self.content = content
+        self.image = None
+        # event_driven为False时模拟只能轮询的剪贴板
+        self.event_driven = event_driven
+        # change_counter为False时模拟没有变化计数的平台
+        self.sequence = 0 if change_counter else None
+
+    def start(self):
+        self._event.clear()
+        return True
+
+    def change_count(self):
+        return self.sequence
+
+    def paste(self):
+        return self.content
+
+    def grab_image(self):
+        return self.image
+
+    def copy_image(self, image):
+        """模拟复制图片（剪贴板中的文本随之清空）"""
+        self.image = image
+        self.copy('')
+
+    def copy(self, content):
+        self.content = content
+        if content:
+            self.image = None
+        if self.sequence is not None:
+            self.sequence += 1
+        if self.event_driven:
+            self.notify()
+
+
+class XFixesClipboardBackend(ClipboardBackend):
+    """X11：通过 XFixes 扩展订阅 CLIPBOARD 所有者变化（ctypes 调用 libX11/libXfixes）"""
+
+    name = 'xfixes'
+    event_driven = True
+    # XFixesSetSelectionOwnerNotifyMask / XFixesSelectionNotify
+    _OWNER_NOTIFY_MASK = 1
+    _SELECTION_NOTIFY = 0
+
+    def __init__(self):
+        super().__init__()
+        self._thread = None
+        self._wake = None
+        # 唤醒管道只由 stop() 关闭；监听线程失败退出和 stop() 可能同时发生
+        self._lock = threading.Lock()
+
+    def start(self):
+        super().start()
+        if not os.environ.get('DISPLAY'):
+            return False
+        from ctypes.util import find_library
+        try:
+            x11 = ctypes.CDLL(find_library('X11') or 'libX11.so.6')
+            xfixes = ctypes.CDLL(find_library('Xfixes') or 'libXfixes.so.3')
+        except OSError as e:
+            logging.info(f"未找到 XFixes 库: {e}")
+            return False
+        
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XInternAtom.restype = ctypes.c_ulong
+        x11.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        x11.XPending.argtypes = [ctypes.c_void_p]
+        x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xfixes.XFixesQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                                ctypes.POINTER(ctypes.c_int)]
+        xfixes.XFixesSelectSelectionInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                                      ctypes.c_ulong, ctypes.c_ulong]
+        
+        display = x11.XOpenDisplay(None)
+        if not display:
+            return False
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not xfixes.XFixesQueryExtension(display, ctypes.byref(event_base), ctypes.byref(error_base)):
+            x11.XCloseDisplay(display)
+            return False
+        clipboard = x11.XInternAtom(display, b'CLIPBOARD', 0)
+        xfixes.XFixesSelectSelectionInput(display, x11.XDefaultRootWindow(display),
+                                          clipboard, self._OWNER_NOTIFY_MASK)
+        
+        self._wake = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run, args=(x11, display, event_base.value + self._SELECTION_NOTIFY,
+                                    self._wake[0]),
+            name='XFixesWatcher', daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, x11, display, notify_type, wake_fd):
+        """监听线程：只有这个线程使用 display 连接"""
+        event = (ctypes.c_long * 24)()  # XEvent 联合体
+        try:
+            fd = x11.XConnectionNumber(display)
+            while True:
+                readable, _, _ = select.select([fd, wake_fd], [], [])
+                if wake_fd in readable:
+                    break
+                while x11.XPending(display):
+                    x11.XNextEvent(display, event)
+                    if ctypes.cast(event, ctypes.POINTER(ctypes.c_int))[0] == notify_type:
+                        self.notify()
+        except Exception as e:
+            logging.error(f"XFixes 监听失败: {e}")
+            self.failed = True
+            self.notify()
+        finally:
+            x11.XCloseDisplay(display)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            wake, self._wake = self._wake, None
+        if thread is not None:
+            try:
+                os.write(wake[1], b'x')
+            except OSError:
+                pass
+            thread.join(timeout=2)
+        if wake is not None:
+            if thread is not None and thread.is_alive():
+                # 监听线程仍在 select 这些 fd，关闭后编号可能被复用，宁可泄漏
+                logging.warning("XFixes 监听线程未退出")
+            else:
+                for fd in wake:
+                    os.close(fd)
+        super().stop()
+
+
+class WaylandClipboardBackend(ClipboardBackend):
+    """Wayland：`wl-paste --watch` 子进程在剪贴板每次变化时输出一行
+
+    需要 wl-clipboard 且合成器支持 data-control 协议。
+    """
+
+    name = 'wayland'
+    event_driven = True
+
+    def __init__(self):
+        super().__init__()
+        self._process = None
+
+    def start(self):
+        super().start()
+        if not os.environ.get('WAYLAND_DISPLAY') or not shutil.which('wl-paste'):
+            return False
+        import subprocess
+        try:
+            self._process = subprocess.Popen(['wl-paste', '--watch', 'echo'],
+                                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            logging.info(f"启动 wl-paste 失败: {e}")
+            return False
+        threading.Thread(target=self._run, args=(self._process,), name='WaylandWatcher',
+                         daemon=True).start()
+        return True
+
+    def _run(self, process):
+        for _ in process.stdout:
+            self.notify()
+        if process is self._process:
+            # 不是 stop() 结束的：合成器不支持或子进程异常退出
+            logging.warning(f"wl-paste 已退出（返回码 {process.wait()}）")
+            self.failed = True
+            self.notify()
+
+    def stop(self):
+        process, self._process = self._process, None
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=2)
+        super().stop()
+
+
+# clipboard_backend 配置可选的后端；auto 依次尝试事件驱动后端，都不可用时轮询
+CLIPBOARD_BACKENDS = {
+    'polling': ClipboardBackend,
+    'xfixes': XFixesClipboardBackend,
+    'wayland': WaylandClipboardBackend,
+    'fake': FakeClipboardBackend,
+}
+
+
+class LocalAddressResolver:
+    """缓存的本机局域网IPv4地址列表
+
+    不依赖外网路由：Linux 上逐个网卡用 ioctl 读取地址，其他平台解析本机
+    主机名。地址按局域网常用网段排序，虚拟网卡（docker、VPN等）排在后面。
+    start() 后由后台线程定时刷新，Linux 上收到 netlink 地址变化通知时
+    立即刷新；请求路径上只读缓存，不做任何 socket 操作。
+    """
+
+    SIOCGIFADDR = 0x8915
+    # 这些网卡通常手机连不上，排在真实网卡之后
+    VIRTUAL_PREFIXES = ('docker', 'br-', 'veth', 'virbr', 'vmnet', 'vboxnet',
+                        'tun', 'tap', 'wg', 'zt', 'tailscale', 'utun')
+    # netlink：RTMGRP_LINK | RTMGRP_IPV4_IFADDR
+    NETLINK_GROUPS = 0x1 | 0x10
+
+    def __init__(self, refresh_interval=10.0, on_change=None):
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        self._addresses = self.enumerate()
+        self._refreshed = time.monotonic()
+
+    @property
+    def addresses(self):
+        """按优先级排序的地址元组；没有后台线程时过期才重新枚举"""
+        if (self._thread is None
+                and time.monotonic() - self._refreshed >= self.refresh_interval):
+            self.refresh()
+        return self._addresses
+
+    @property
+    def primary(self):
+        """首选地址，没有可用网卡时为 127.0.0.1"""
+        addresses = self.addresses
+        return addresses[0] if addresses else '127.0.0.1'
+
+    def refresh(self):
+        """重新枚举网卡，地址变化时调用 on_change 并返回True"""
+        addresses = self.enumerate()
+        with self._lock:
+            changed = addresses != self._addresses
+            self._addresses = addresses
+            self._refreshed = time.monotonic()
+        if changed:
+            logging.info(f"本机地址变化: {', '.join(addresses) or '无'}")
+            if self.on_change:
+                self.on_change(addresses)
+        return changed
+
+    @classmethod
+    def enumerate(cls):
+        """枚举本机IPv4地址（不含回环和链路本地地址），按优先级排序"""
+        ranked = {}
+        for name, ip in cls.interface_addresses() + cls.hostname_addresses():
+            rank = cls.rank(ip, name)
+            if rank is not None and rank < ranked.get(ip, rank + 1):
+                ranked[ip] = rank
+        return tuple(sorted(ranked, key=lambda ip: (ranked[ip], socket.inet_aton(ip))))
+
+    @classmethod
+    def rank(cls, ip, name=None):
+        """地址的排序权重，越小越优先；不可用的地址返回None"""
+        try:
+            a, b = socket.inet_aton(ip)[:2]
+        except OSError:
+            return None
+        if a in (0, 127) or (a, b) == (169, 254) or a >= 224:
+            return None
+        if (a, b) == (192, 168):
+            rank = 0
+        elif a == 10:
+            rank = 1
+        elif a == 172 and 16 <= b <= 31:
+            rank = 2
+        else:
+            rank = 3
+        if name and name.startswith(cls.VIRTUAL_PREFIXES):
+            rank += 10
+        return rank
+
+    @classmethod
+    def interface_addresses(cls):
+        """Linux：用 SIOCGIFADDR 读取每个网卡的地址，返回 [(网卡名, IP)]"""
+        if not sys.platform.startswith('linux'):
+            return []
+        try:
+            import fcntl
+            names = [name for _, name in socket.if_nameindex()]
+        except (ImportError, OSError) as e:
+            logging.debug(f"无法列出网卡: {e}")
+            return []
+        result = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for name in names:
+                try:
+                    data = fcntl.ioctl(s.fileno(), cls.SIOCGIFADDR,
+                                       struct.pack('256s', name.encode()[:15]))
+                except OSError:
+                    continue  # 网卡没有IPv4地址
+                result.append((name, socket.inet_ntoa(data[20:24])))
+        return result
+
+    @staticmethod
+    def hostname_addresses():
+        """解析本机主机名得到的地址（Windows/macOS 上包含所有网卡）"""
+        try:
+            infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+        except OSError:
+            return []
+        return [(None, info[4][0]) for info in infos]
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is not None:
+            return
+        # 每个线程用自己的停止事件，stop() 后立即 start() 也不会有两个线程
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, args=(self._stop,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台刷新，之后读取地址时按需刷新"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread = None
+
+    def _open_netlink(self):
+        """订阅 Linux 网卡和地址变化通知，不支持时返回None"""
+        if not hasattr(socket, 'AF_NETLINK'):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)  # NETLINK_ROUTE
+            sock.bind((0, self.NETLINK_GROUPS))
+            sock.setblocking(False)
+            return sock
+        except OSError as e:
+            logging.debug(f"无法订阅网络变化通知: {e}")
+            return None
+
+    def _watch(self, stop):
+        netlink = self._open_netlink()
+        try:
+            while not stop.is_set():
+                if netlink is None:
+                    stop.wait(self.refresh_interval)
+                else:
+                    readable, _, _ = select.select([netlink], [], [], self.refresh_interval)
+                    if readable:
+                        # 一次配置变更会产生多条消息，稍等后一起处理
+                        stop.wait(0.5)
+                        try:
+                            while netlink.recv(65536):
+                                pass
+                        except OSError:
+                            pass
+                if stop.is_set():
+                    break
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f"刷新本机地址失败: {e}")
+        finally:
+            if netlink is not None:
+                netlink.close()
+
 
 class ClipboardMonitor:
     """剪贴板监控器类"""
@@ -39,19 +2060,56 @@ class ClipboardMonitor:
         
         # 监控状态
         self.monitoring = False
-        self.last_clipboard_content = ""
-        self.clipboard_history = []
+        # 只保存上次内容的指纹（长度+哈希）和系统变化计数，不保留内容本身
+        self.last_clipboard_fingerprint = None
+        self.last_change_count = None
         
         # 服务器相关
         self.server = None
         self.server_thread = None
         self.server_running = False
         
+        # 状态变化的监听函数 listener(event, data)，在发生变化的线程中调用。
+        # 事件：history（新记录）、reset（历史清空）、status（监控或服务器启停）、
+        # clients（手机实时连接数）
+        self.listeners = []
+        
+        # 推送给手机端的事件（/api/events）
+        self.events = EventBroadcaster()
+        self.events.on_subscribers_changed = lambda count: self.notify_listeners('clients', count)
+        
+        # 渲染好的手机页面：(缓存键, PrecompressedBody)
+        self._page_cache = None
+        self._page_lock = threading.Lock()
+        # 二维码 PNG 缓存：(地址, 模块大小, 边框) -> PrecompressedBody，最近使用的在后
+        self._qr_cache = OrderedDict()
+        self._qr_lock = threading.Lock()
+        # 本机地址缓存，服务器运行时后台刷新，地址变化时丢弃缓存的页面
+        self.address_resolver = LocalAddressResolver(
+            self.config.get('ip_refresh_interval', 10.0), self.on_addresses_changed)
+        # 静态资源表，第一次使用时创建（见 get_static_assets）
+        self.static_assets = None
+        self._assets_lock = threading.Lock()
+        
         # 读取配置
         self.save_path = self.config.get('save_path', 'clipboard_history.txt')
-        self.check_interval = self.config.get('check_interval', 1.0)
+        self.adaptive_polling = self.config.get('adaptive_polling', True)
+        self.set_check_interval(self.config.get('check_interval', 1.0))
         self.auto_save = self.config.get('auto_save', True)
         self.max_history = self.config.get('max_history', 100)
+        # 剪贴板中没有文本时检查图片，图片按内容哈希保存在 image_dir 中
+        self.capture_images = self.config.get('capture_images', True)
+        self.image_store = ImageStore(self.config.get('image_dir', 'clipboard_images'),
+                                      self.config.get('thumbnail_size', 256))
+        self.clipboard_backend = self.create_clipboard_backend()
+        self.clipboard_history = HistoryStore(
+            self.max_history, self.config.get('history_move_to_top', False),
+            self.open_history_database())
+        self.clipboard_history.on_removed = self.on_history_removed
+        self.history_writer = HistoryWriter(
+            self.config.get('flush_interval', 1.0),
+            self.config.get('flush_batch_size', 100),
+            self.config.get('fsync', 'never'))
         
         
         logging.info("剪贴板监控器初始化完成")
@@ -70,15 +2128,50 @@ class ClipboardMonitor:
             logging.error(f"配置文件加载失败: {e}")
             return self.get_default_config()
     
+    def open_history_database(self):
+        """history_backend 为 sqlite 时打开历史数据库，失败则退回内存存储"""
+        if self.config.get('history_backend', 'memory') != 'sqlite':
+            return None
+        try:
+            return HistoryDatabase(self.config.get('history_db_path', 'clipboard_history.db'),
+                                   self.config.get('history_retention', 0))
+        except Exception as e:
+            logging.error(f"历史数据库打开失败，使用内存存储: {e}")
+            return None
+    
     def get_default_config(self):
         """获取默认配置"""
         return {
             "save_path": "clipboard_history.txt",
             "check_interval": 1.0,
+            "adaptive_polling": True,
+            "min_check_interval": 0.2,
+            "max_check_interval": 3.0,
             "auto_save": True,
             "max_history": 100,
             "server_port": 9999,
-            "enable_server": True
+            "enable_server": True,
+            "server_engine": "threading",
+            "server_workers": 16,
+            "keep_alive_timeout": 15,
+            "keep_alive_max_requests": 100,
+            "history_move_to_top": False,
+            "max_event_clients": 8,
+            "event_ping_interval": 10,
+            "preview_length": 500,
+            "flush_interval": 1.0,
+            "flush_batch_size": 100,
+            "fsync": "never",
+            "history_backend": "memory",
+            "history_db_path": "clipboard_history.db",
+            "history_retention": 0,
+            "clipboard_backend": "auto",
+            "compress_responses": True,
+            "compress_min_size": 1024,
+            "ip_refresh_interval": 10.0,
+            "capture_images": True,
+            "image_dir": "clipboard_images",
+            "thumbnail_size": 256
         }
     
     def save_config(self):
@@ -93,32 +2186,62 @@ class ClipboardMonitor:
     def add_to_history(self, content, content_type='text'):
         """添加到历史记录"""
         if content:
-            history_item = {
-                'content': content,
-                'type': content_type,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            # 检查是否已存在（避免重复）
-            for item in self.clipboard_history:
-                if item['content'] == content and item['type'] == content_type:
-                    return
+            # 重复内容由历史记录按哈希识别
+            history_item = self.clipboard_history.add(content, content_type)
+            if history_item is None:
+                return
             
-            self.clipboard_history.insert(0, history_item)
-            # 限制历史记录数量
-            if len(self.clipboard_history) > self.max_history:
-                self.clipboard_history = self.clipboard_history[:self.max_history]
+            # 推送给已连接的手机
+            self.events.publish('history', history_item)
+            self.notify_listeners('history', history_item)
+    
+    def on_history_removed(self, items):
+        """历史记录中删除的图片，同时删除图片文件"""
+        for item in items:
+            if item['type'] == 'image':
+                self.image_store.delete(item['content'])
+    
+    def clear_history(self):
+        """清空历史记录，并通知手机重新加载"""
+        self.clipboard_history.clear()
+        self.events.publish('reset')
+        self.notify_listeners('reset')
+    
+    def notify_listeners(self, event, data=None):
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                logging.error(f"状态监听函数出错: {e}")
+    
+    @staticmethod
+    def content_fingerprint(content):
+        """剪贴板内容的指纹：长度 + 字符串哈希
+
+        指纹只在本进程内比较，直接用内置 hash()，不需要先编码成字节。
+        """
+        return len(content), hash(content)
     
     def check_clipboard(self):
         """检查剪贴板内容"""
         try:
+            # 变化计数没变时不读取剪贴板（大段内容读取和哈希都不便宜）
+            change_count = self.clipboard_backend.change_count()
+            if change_count is not None and change_count == self.last_change_count:
+                return False
+            
             # 检查文本内容
-            current_content = pyperclip.paste()
+            current_content = self.clipboard_backend.paste()
+            self.last_change_count = change_count
+            if not current_content:
+                # 复制图片时剪贴板中没有文本
+                return self.capture_images and self.check_clipboard_image(change_count is not None)
             
-            content_changed = current_content != self.last_clipboard_content
+            fingerprint = self.content_fingerprint(current_content)
+            content_changed = fingerprint != self.last_clipboard_fingerprint
             
-            if content_changed and current_content:
-                self.last_clipboard_content = current_content
+            if content_changed:
+                self.last_clipboard_fingerprint = fingerprint
                 
                 # 添加到历史记录
                 self.add_to_history(current_content, 'text')
@@ -133,27 +2256,66 @@ class ClipboardMonitor:
             return False
             
         except Exception as e:
+            if self.clipboard_backend.is_unavailable_error(e):
+                # 没有剪贴板时每次检查都会失败：只提示一次，停止监控，服务器继续运行
+                logging.warning(f"无法访问剪贴板，停止监控（服务器继续运行）: {e}")
+                self.stop_monitoring()
+                return False
             logging.error(f"检查剪贴板时发生错误: {e}")
             return False
     
     
-    def save_to_file(self, content, content_type='text'):
-        """保存内容到文件"""
+    def check_clipboard_image(self, counted=False):
+        """检查剪贴板中的图片，有新图片时保存并加入历史记录（内容为图片哈希）
+
+        counted 为True表示变化计数刚报告了变化，此时不用快速签名跳过。
+        """
         try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            if content_type == 'text':
-                with open(self.save_path, 'a', encoding='utf-8') as f:
-                    f.write(f"[{timestamp}] 文本: {content}\n")
-                    f.write("-" * 50 + "\n")
-                logging.info(f"文本内容已保存: {content[:50]}...")
-        except Exception as e:
-            logging.error(f"保存文件失败: {e}")
+            image = self.clipboard_backend.grab_image()
+        except (ImportError, NotImplementedError, OSError) as e:
+            # 平台不支持时不再每次尝试
+            logging.warning(f"无法读取剪贴板图片，停止记录图片: {e}")
+            self.capture_images = False
+            return False
+        if image is None:
+            return False
+        
+        # 没有变化计数的平台上每次轮询都会读到同一张图片，先比较快速签名；
+        # 签名只覆盖部分像素行，有变化计数时仍以完整哈希为准
+        signature = ImageStore.image_signature(image)
+        last = self.last_clipboard_fingerprint
+        if not counted and last is not None and last[:2] == ('image', signature):
+            return False
+        key = ImageStore.image_hash(image)
+        if last is not None and last[0] == 'image' and last[2] == key:
+            return False
+        self.last_clipboard_fingerprint = ('image', signature, key)
+        
+        self.image_store.save(image, key)
+        self.add_to_history(key, 'image')
+        if self.auto_save:
+            self.save_to_file(key, 'image')
+        logging.info(f"检测到新剪贴板图片: {image.width}x{image.height}")
+        return True
+    
+    def save_to_file(self, content, content_type='text'):
+        """保存内容到文件（由后台线程批量写入）"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        if content_type == 'text':
+            self.history_writer.write(self.save_path,
+                                      f"[{timestamp}] 文本: {content}\n" + "-" * 50 + "\n")
+        elif content_type == 'image':
+            self.history_writer.write(self.save_path,
+                                      f"[{timestamp}] 图片: {self.image_store.image_path(content)}\n"
+                                      + "-" * 50 + "\n")
     
     def set_clipboard_content(self, content):
         """设置电脑剪贴板内容"""
         try:
-            pyperclip.copy(content)
+            self.clipboard_backend.copy(content)
+            # 避免监控线程把刚设置的内容当作新内容再记录一次
+            self.last_clipboard_fingerprint = self.content_fingerprint(content)
             self.add_to_history(content, 'text')
             if self.auto_save:
                 self.save_to_file(content, 'text')
@@ -170,32 +2332,96 @@ class ClipboardMonitor:
             return
         
         self.monitoring = True
-        logging.info("开始监控剪贴板")
+        self.clipboard_backend = self.start_clipboard_backend()
+        logging.info(f"开始监控剪贴板（{self.clipboard_backend.name}）")
         
         def monitor_loop():
+            backend = self.clipboard_backend
             while self.monitoring:
-                self.check_clipboard()
-                time.sleep(self.check_interval)
+                changed = self.check_clipboard()
+                interval = self.poll_scheduler.record(changed)
+                # 事件驱动后端忽略间隔，只在收到通知时返回
+                backend.wait(interval if self.adaptive_polling else self.check_interval)
+                if backend.failed and self.monitoring:
+                    logging.warning(f"剪贴板后端 {backend.name} 失效，改用轮询")
+                    try:
+                        backend.stop()
+                    except Exception as e:
+                        logging.error(f"停止剪贴板后端 {backend.name} 失败: {e}")
+                    backend = self.clipboard_backend = ClipboardBackend()
+                    backend.start()
         
         self.monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
         self.monitor_thread.start()
+        self.notify_listeners('status')
+    
+    def set_check_interval(self, interval, max_interval=None):
+        """设置检查间隔和自适应轮询空闲时的最长间隔
+
+        固定轮询按 interval 检查；自适应轮询检测到变化后缩短到 min_check_interval，
+        空闲时逐步延长到 max_check_interval（不小于 interval），比固定轮询唤醒得更少。
+        """
+        self.check_interval = interval
+        self.config['check_interval'] = interval
+        if max_interval is not None:
+            self.config['max_check_interval'] = max_interval
+        self.poll_scheduler = AdaptivePollScheduler(
+            min(self.config.get('min_check_interval', 0.2), interval),
+            max(self.config.get('max_check_interval', 3.0), interval))
+    
+    def create_clipboard_backend(self):
+        """按 clipboard_backend 配置创建后端（auto 在开始监控时再选择）"""
+        choice = self.config.get('clipboard_backend', 'auto')
+        if choice != 'auto' and choice not in CLIPBOARD_BACKENDS:
+            logging.warning(f"未知的剪贴板后端 {choice}，使用轮询")
+        return CLIPBOARD_BACKENDS.get(choice, ClipboardBackend)()
+    
+    def start_clipboard_backend(self):
+        """启动变化检测后端，不可用时退回轮询"""
+        choice = self.config.get('clipboard_backend', 'auto')
+        if choice == 'auto':
+            candidates = [WaylandClipboardBackend(), XFixesClipboardBackend()]
+        else:
+            candidates = [self.clipboard_backend]
+        
+        for backend in candidates:
+            try:
+                if backend.start():
+                    return backend
+            except Exception as e:
+                logging.error(f"剪贴板后端 {backend.name} 启动失败: {e}")
+            if choice != 'auto':
+                logging.warning(f"剪贴板后端 {backend.name} 不可用，使用轮询")
+        backend = ClipboardBackend()
+        backend.start()
+        return backend
     
     def stop_monitoring(self):
         """停止监控剪贴板"""
         self.monitoring = False
+        self.clipboard_backend.stop()
         logging.info("停止监控剪贴板")
+        self.notify_listeners('status')
     
     def get_local_ip(self):
-        """获取本地IP地址"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except Exception as e:
-            logging.error(f"获取本地IP失败: {e}")
-            return "127.0.0.1"
+        """获取本地IP地址（首选网卡，来自缓存）"""
+        return self.address_resolver.primary
+    
+    def get_server_port(self):
+        """服务器实际监听的端口（server_port 为0时由系统分配）"""
+        if self.server is not None:
+            return self.server.server_address[1]
+        return self.config.get('server_port', 9999)
+    
+    def get_server_urls(self):
+        """本机每个可用地址对应的访问地址，首选地址在前"""
+        port = self.get_server_port()
+        addresses = self.address_resolver.addresses or ('127.0.0.1',)
+        return [f"http://{ip}:{port}" for ip in addresses]
+    
+    def on_addresses_changed(self, addresses):
+        """本机地址变化（换了网络）后重新生成页面"""
+        self.invalidate_page_cache()
     
     def start_server(self):
         """启动HTTP服务器"""
@@ -203,102 +2429,555 @@ class ClipboardMonitor:
             return
         
         port = self.config.get('server_port', 9999)
+        self.invalidate_page_cache()
+        self.address_resolver.start()
+        # 在处理请求前加载静态资源
+        self.get_static_assets()
         
         class ClipboardHandler(BaseHTTPRequestHandler):
+            # HTTP/1.1 长连接：每个响应都必须带 Content-Length
+            protocol_version = 'HTTP/1.1'
+            # 头部和正文分两次发送，关闭Nagle避免与延迟ACK叠加产生40ms卡顿
+            disable_nagle_algorithm = True
+            
             def __init__(self, clipboard_monitor, *args, **kwargs):
                 self.clipboard_monitor = clipboard_monitor
+                # 空闲超时（秒）和单个连接最多处理的请求数
+                self.timeout = clipboard_monitor.config.get('keep_alive_timeout', 15)
+                self.max_requests = clipboard_monitor.config.get('keep_alive_max_requests', 100)
+                if clipboard_monitor.config.get('server_engine') == 'single':
+                    # 单线程服务器上长连接会独占服务器，每个请求后关闭连接
+                    self.max_requests = 1
                 super().__init__(*args, **kwargs)
             
+            def setup(self):
+                super().setup()
+                # asyncio引擎每个请求创建一个处理器，连接上已处理的请求数由连接对象记录；
+                # 线程池引擎上等待过下一个请求的连接由服务器记录
+                if hasattr(self.server, 'requests_served'):
+                    self.requests_handled = self.server.requests_served(self.request)
+                else:
+                    self.requests_handled = getattr(self.connection, 'requests_served', 0)
+                # 线程池引擎上等待下一个请求的时间，None表示使用 self.timeout
+                self.idle_timeout = getattr(self.server, 'keep_alive_idle_timeout', None)
+                self.detached = None
+            
+            def handle_one_request(self):
+                """长连接上还没有下一个请求时把连接交给服务器等待，不占用工作线程"""
+                if self.requests_handled and hasattr(self.server, 'park_request'):
+                    self.connection.settimeout(0)
+                    try:
+                        # 缓冲区为空时再看socket：对方已关闭返回b''，没有数据抛出 BlockingIOError
+                        ready = self.rfile.peek(1) or self.connection.recv(1, socket.MSG_PEEK)
+                    except BlockingIOError:
+                        self.server.park_request(self.request, self.client_address,
+                                                 self.requests_handled)
+                        ready = b''
+                    except OSError:
+                        ready = b''
+                    finally:
+                        self.connection.settimeout(self.timeout)
+                    if not ready:
+                        self.close_connection = True
+                        return
+                super().handle_one_request()
+            
+            def finish(self):
+                # 转交给专用线程的连接由该线程关闭
+                if self.detached is None:
+                    super().finish()
+                else:
+                    self.detached.set()
+            
+            def can_stream(self):
+                """服务器能否把推送连接转交给专用线程
+
+                单线程引擎不能：推送连接会占住唯一的服务线程，让其他请求全部等待。
+                """
+                return hasattr(self.server, 'detach_request')
+            
+            def run_stream(self, target, *args):
+                """在专用线程中运行长期推送连接，不占用请求线程池"""
+                self.detached = threading.Event()
+                self.server.detach_request(self.request)
+                
+                def run():
+                    try:
+                        target(*args)
+                    finally:
+                        # 等请求线程的 handle() 返回后再关闭文件对象
+                        self.detached.wait()
+                        try:
+                            BaseHTTPRequestHandler.finish(self)
+                        except OSError:
+                            pass
+                        self.server.release_request(self.request)
+                threading.Thread(target=run, name='event-stream', daemon=True).start()
+            
+            def end_headers(self):
+                """补充长连接相关的响应头"""
+                self.requests_handled += 1
+                if not self.close_connection:
+                    if self.requests_handled >= self.max_requests:
+                        self.send_header('Connection', 'close')
+                    else:
+                        self.send_header('Connection', 'keep-alive')
+                        idle = self.timeout if self.idle_timeout is None else self.idle_timeout
+                        self.send_header('Keep-Alive', f'timeout={max(int(idle), 1)}, '
+                                         f'max={self.max_requests - self.requests_handled}')
+                super().end_headers()
+            
+            def json_stream(self, status=200, headers=None):
+                """创建JSON响应流，按 Accept-Encoding 压缩较大的正文"""
+                monitor = self.clipboard_monitor
+                encoding = None
+                if monitor.config.get('compress_responses', True):
+                    encoding = StreamingResponse.negotiate(self.headers.get('Accept-Encoding'))
+                headers = dict(headers or {})
+                headers['Vary'] = 'Accept-Encoding'
+                return StreamingResponse(self, 'application/json; charset=utf-8', status, headers,
+                                         encoding, monitor.config.get('compress_min_size', 1024))
+            
+            def send_json(self, data, status=200, headers=None):
+                """发送JSON响应"""
+                stream = self.json_stream(status, headers)
+                stream.write_json(data)
+                stream.finish()
+            
+            def send_body(self, body, content_type, status=200, headers=None):
+                """发送带 Content-Length 的完整响应"""
+                self.send_response(status)
+                self.send_header('Content-type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+            
             def do_GET(self):
                 if self.path == '/':
                     self.serve_html()
                 elif self.path == '/test':
                     self.serve_test_page()
+                elif self.path.startswith('/static/'):
+                    self.serve_static()
+                elif self.path.startswith('/qr.png'):
+                    self.serve_qr_code()
+                elif self.path.startswith('/api/image/'):
+                    self.serve_image()
+                elif self.path.startswith('/api/thumb/'):
+                    self.serve_image(thumbnail=True)
                 elif self.path.startswith('/api/history'):
                     self.serve_history()
+                elif self.path.startswith('/api/search'):
+                    self.serve_search()
+                elif self.path.startswith('/api/events'):
+                    self.serve_events()
+                elif self.path.startswith('/api/ws'):
+                    self.serve_websocket()
+                else:
+                    self.send_404()
+            
+            def do_POST(self):
+                if self.path.startswith('/api/set_clipboard'):
+                    self.set_clipboard_from_mobile()
+                else:
+                    self.send_404()
+            
+            def serve_html(self):
+                """服务HTML页面（使用缓存的预压缩页面）"""
+                self.send_cached(self.clipboard_monitor.get_cached_page(), 'no-cache')
+            
+            def send_cached(self, cached, cache_control):
+                """发送 PrecompressedBody：按 Accept-Encoding 选择版本，ETag 匹配时返回304"""
+                encoding, body, etag = cached.select(self.headers.get('Accept-Encoding'))
+                headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    return
+                if encoding != 'identity':
+                    headers['Content-Encoding'] = encoding
+                self.send_body(body, cached.content_type, headers=headers)
+            
+            def serve_test_page(self):
+                """服务测试页面（启动服务器时已读入内存）"""
+                self.send_cached(self.clipboard_monitor.get_static_assets().test_page, 'no-cache')
+            
+            def serve_static(self):
+                """服务 /static/ 下的静态资源：URL 带内容哈希，内容不会变化，可以永久缓存"""
+                asset = self.clipboard_monitor.get_static_assets().get(urlparse(self.path).path)
+                if asset is None:
+                    self.send_404()
+                    return
+                self.send_cached(asset, 'public, max-age=31536000, immutable')
+            
+            def serve_image(self, thumbnail=False):
+                """服务 /api/image/<哈希>（原图PNG）和 /api/thumb/<哈希>（缩略图JPEG）
+
+                文件按内容哈希命名，内容不会变化，可以永久缓存。
+                """
+                store = self.clipboard_monitor.image_store
+                key = urlparse(self.path).path.rsplit('/', 1)[-1]
+                if not store.valid(key):
+                    self.send_404()
+                    return
+                if thumbnail:
+                    path, content_type, etag = store.thumbnail(key), 'image/jpeg', f'"{key}-thumb"'
+                else:
+                    path, content_type, etag = store.image_path(key), 'image/png', f'"{key}"'
+                headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    return
+                try:
+                    image_file = open(path, 'rb') if path else None
+                except OSError:
+                    image_file = None
+                if image_file is None:
+                    self.send_404()
+                    return
+                with image_file:
+                    self.send_response(200)
+                    self.send_header('Content-type', content_type)
+                    self.send_header('Content-Length', str(os.fstat(image_file.fileno()).st_size))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    # 原图可能很大，分块从文件复制到连接
+                    shutil.copyfileobj(image_file, self.wfile, StreamingResponse.CHUNK_SIZE)
+            
+            def serve_qr_code(self):
+                """服务 /qr.png：本机访问地址的二维码，供局域网内其他设备显示
+
+                默认编码请求时使用的地址（Host 为本机地址时），也可用 ip=<本机地址>
+                指定；size=<n> 为每个模块的像素数。只接受本机地址，避免缓存被任意内容填满。
+                """
+                monitor = self.clipboard_monitor
+                query = parse_qs(urlparse(self.path).query)
+                addresses = monitor.address_resolver.addresses
+                host = (self.headers.get('Host') or '').split(':')[0]
+                ip = query.get('ip', [host])[0]
+                if ip not in addresses:
+                    ip = monitor.get_local_ip()
+                try:
+                    box_size = min(max(int(query.get('size', ['10'])[0]), 1), 40)
+                except ValueError:
+                    box_size = 10
+                port = monitor.get_server_port()
+                self.send_cached(monitor.get_qr_code(f"http://{ip}:{port}", box_size), 'no-cache')
+            
+            def serve_history(self):
+                """服务历史记录API
+
+                /api/history 返回完整列表；/api/history?since=<id> 只返回比id新的记录：
+                {"items": [...], "latest": 最新id, "oldest": 仍可读取的最旧id, "total": 总条数}
+                （使用数据库时 oldest 包括分页加载的、只在数据库中的记录）
+                /api/history?limit=<n>&before=<id> 分页返回：
+                {"items": [...], "next": 下一页的before或null, "latest": 最新id, "total": 总条数}
+                preview=<n> 把每条内容截断为n个字符（完整内容用 /api/history/<id> 获取）
+                """
+                if urlparse(self.path).path.startswith('/api/history/'):
+                    self.serve_history_item()
+                    return
+                
+                # 整个请求使用同一个快照，期间的写入不影响本次响应
+                history = self.clipboard_monitor.clipboard_history.snapshot()
+                latest = history.last_id
+                # 最新序号和条数确定了历史记录的状态（条数用于识别清空）
+                etag = f'"{latest}-{len(history)}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                
+                query = parse_qs(urlparse(self.path).query)
+                try:
+                    since = self.int_param(query, 'since')
+                    before = self.int_param(query, 'before')
+                    limit = self.int_param(query, 'limit')
+                    preview = self.int_param(query, 'preview')
+                except ValueError:
+                    self.send_error(400, 'Invalid query parameter')
+                    return
+                paginated = limit is not None or before is not None
+                if paginated:
+                    limit = min(max(limit or HISTORY_PAGE_MAX, 1), HISTORY_PAGE_MAX)
+                
+                # 逐条编码并发送（最新的在前，遇到旧记录即可停止），不在内存中拼出完整响应
+                stream = self.json_stream(headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+                encode = json.JSONEncoder(ensure_ascii=False).encode
+                stream.write('[' if since is None and not paginated else '{"items": [')
+                count = 0
+                last_id = None
+                next_cursor = None
+                
+                def emit(item):
+                    nonlocal count, last_id
+                    stream.write((', ' if count else '') + encode(self.format_history_item(item, preview)))
+                    count += 1
+                    last_id = item['id']
+                
+                for item in history:
+                    if since is not None and item['id'] <= since:
+                        break
+                    if before is not None and item['id'] >= before:
+                        continue
+                    if paginated and count >= limit:
+                        next_cursor = last_id
+                        break
+                    emit(item)
+                
+                store = self.clipboard_monitor.clipboard_history
+                if paginated and since is None and next_cursor is None:
+                    # 内存中的记录不够一页时，继续从数据库读取更早的记录
+                    cursor = history.oldest_id if before is None else min(before, history.oldest_id)
+                    remaining = limit - count
+                    older = store.older(cursor, remaining + 1)
+                    for item in older[:remaining]:
+                        emit(item)
+                    if len(older) > remaining:
+                        next_cursor = last_id
+                
+                if since is not None:
+                    # 客户端删除比 oldest 更早的记录：只在数据库中的旧记录不能算作已删除
+                    meta = {'latest': latest, 'oldest': store.oldest_id, 'total': store.total}
+                elif paginated:
+                    meta = {'next': next_cursor, 'latest': latest, 'total': store.total}
                 else:
-                    self.send_404()
+                    meta = None
+                # 其余字段放在 items 之后，它们要等遍历结束才能确定
+                stream.write(']' if meta is None else '], ' + encode(meta)[1:])
+                stream.finish()
             
-            def do_POST(self):
-                if self.path.startswith('/api/set_clipboard'):
-                    self.set_clipboard_from_mobile()
-                else:
+            
+            def serve_history_item(self):
+                """返回单条历史记录的完整内容：/api/history/<id>"""
+                try:
+                    item_id = int(urlparse(self.path).path.rsplit('/', 1)[1])
+                except ValueError:
+                    self.send_404()
+                    return
+                
+                item = self.clipboard_monitor.clipboard_history.get(item_id)
+                if item is None:
                     self.send_404()
+                    return
+                
+                # 记录内容不会变化，可以让浏览器缓存
+                self.send_json(self.format_history_item(item),
+                               headers={'Cache-Control': 'private, max-age=3600'})
             
-            def serve_html(self):
-                """服务HTML页面"""
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html; charset=utf-8')
-                self.end_headers()
+            def serve_search(self):
+                """全文搜索：/api/search?q=<关键词>&limit=<n>&preview=<n>
+
+                返回 {"query": 关键词, "items": [...]}，按相关度排序
+                """
+                query = parse_qs(urlparse(self.path).query)
+                keywords = query.get('q', [''])[0].strip()
+                try:
+                    limit = self.int_param(query, 'limit')
+                    preview = self.int_param(query, 'preview')
+                except ValueError:
+                    self.send_error(400, 'Invalid query parameter')
+                    return
+                limit = min(max(limit or 50, 1), HISTORY_PAGE_MAX)
                 
-                html = self.clipboard_monitor.get_server_page()
-                self.wfile.write(html.encode('utf-8'))
+                items = self.clipboard_monitor.clipboard_history.search(keywords, limit) if keywords else []
+                self.send_json({
+                    'query': keywords,
+                    'items': [self.format_history_item(item, preview) for item in items]
+                }, headers={'Cache-Control': 'no-cache'})
             
-            def serve_test_page(self):
-                """服务测试页面"""
+            @staticmethod
+            def format_history_item(item, preview=None):
+                """转换为API返回的格式，preview指定时截断内容
+
+                图片记录的内容是图片哈希，另给出原图和缩略图的地址，图片本身不放进JSON。
+                """
+                data = {
+                    'id': item['id'],
+                    'content': item['content'],
+                    'type': item['type'],
+                    'timestamp': item['timestamp']
+                }
+                if item['type'] == 'image':
+                    data['image'] = f"/api/image/{item['content']}"
+                    data['thumbnail'] = f"/api/thumb/{item['content']}"
+                elif preview is not None and len(item['content']) > preview:
+                    data['content'] = item['content'][:max(preview, 0)]
+                    data['truncated'] = True
+                    data['length'] = len(item['content'])
+                return data
+            
+            @staticmethod
+            def int_param(query, name):
+                """读取整数查询参数，不存在时返回None"""
+                return int(query[name][0]) if name in query else None
+            
+            def serve_events(self):
+                """Server-Sent Events：实时推送新的剪贴板记录"""
+                monitor = self.clipboard_monitor
+                # 每个事件流占用一个专用线程，超过上限或单线程引擎时让客户端退回轮询
+                subscriber = None
+                if self.can_stream():
+                    subscriber = monitor.events.subscribe(monitor.config.get('max_event_clients', 8))
+                if subscriber is None:
+                    self.send_body(b'Too many event streams', 'text/plain; charset=utf-8', 503)
+                    return
                 try:
-                    with open('mobile_test.html', 'r', encoding='utf-8') as f:
-                        html_content = f.read()
-                    
                     self.send_response(200)
-                    self.send_header('Content-type', 'text/html; charset=utf-8')
+                    self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+                    self.send_header('Cache-Control', 'no-cache')
+                    # 事件流没有长度，以关闭连接结束
+                    self.send_header('Connection', 'close')
                     self.end_headers()
-                    self.wfile.write(html_content.encode('utf-8'))
-                except FileNotFoundError:
-                    # 如果测试文件不存在，返回一个简单的测试页面
-                    html = """<!DOCTYPE html>
-                    <html lang="zh-CN">
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>手机界面兼容性测试</title>
-                        <style>
-                            body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background-color: #f5f5f5; margin: 0; padding: 20px; }
-                            .container { background: white; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
-                            .test-result { margin: 10px 0; padding: 10px; background: #d4edda; border-left: 4px solid #28a745; border-radius: 4px; }
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <h1>📱 剪贴板监控器手机界面兼容性测试</h1>
-                            <div class="test-result">
-                                ✅ 测试文件未找到，但主界面已优化完成！<br>
-                                ✅ 支持320px-768px屏幕宽度<br>
-                                ✅ 触摸优化：按钮最小高度44px<br>
-                                ✅ 字体适配：根据不同屏幕调整大小<br>
-                                ✅ 交互反馈：触摸点击有视觉反馈<br>
-                                ✅ 平滑滚动：支持触摸滚动<br>
-                                <br>
-                                <a href="/" style="display: inline-block; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 6px;">🏠 返回主界面</a>
-                            </div>
-                        </div>
-                    </body>
-                    </html>"""
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html; charset=utf-8')
-                    self.end_headers()
-                    self.wfile.write(html.encode('utf-8'))
+                    self.wfile.write(b'retry: 3000\n\n')
+                except OSError:
+                    monitor.events.unsubscribe(subscriber)
+                    return
+                self.run_stream(self.event_stream, subscriber)
             
-            def serve_history(self):
-                """服务历史记录API"""
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.end_headers()
+            def event_stream(self, subscriber):
+                """向事件流客户端转发推送事件，直到断开或服务器停止"""
+                monitor = self.clipboard_monitor
+                try:
+                    while monitor.server_running:
+                        try:
+                            message = subscriber.get(timeout=monitor.config.get('event_ping_interval', 10))
+                        except queue.Empty:
+                            # 心跳：保持连接并及时发现已断开的客户端
+                            self.wfile.write(b': ping\n\n')
+                            continue
+                        if message is None:
+                            break
+                        event, data = message
+                        if event == 'history':
+                            data = self.format_history_item(data, monitor.config.get('preview_length', 500))
+                        payload = json.dumps(data, ensure_ascii=False)
+                        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode('utf-8'))
+                except OSError:
+                    # 客户端断开
+                    pass
+                finally:
+                    monitor.events.unsubscribe(subscriber)
+            
+            def serve_websocket(self):
+                """WebSocket双向同步：推送新记录，并接收手机发送的文本"""
+                monitor = self.clipboard_monitor
+                key = self.headers.get('Sec-WebSocket-Key')
+                if self.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+                    self.send_body(b'Expected WebSocket upgrade', 'text/plain; charset=utf-8', 400)
+                    return
+                # 和事件流共用连接数上限
+                subscriber = None
+                if self.can_stream():
+                    subscriber = monitor.events.subscribe(monitor.config.get('max_event_clients', 8))
+                if subscriber is None:
+                    self.send_body(b'Too many event streams', 'text/plain; charset=utf-8', 503)
+                    return
                 
-                # 返回格式化的历史记录
-                history_data = []
-                if self.clipboard_monitor.clipboard_history:
-                    for item in self.clipboard_monitor.clipboard_history:
-                        history_data.append({
-                            'content': item['content'],
-                            'type': item['type'],
-                            'timestamp': item['timestamp']
-                        })
+                self.send_response(101, 'Switching Protocols')
+                self.send_header('Upgrade', 'websocket')
+                self.send_header('Connection', 'Upgrade')
+                self.send_header('Sec-WebSocket-Accept', WebSocketConnection.accept_key(key))
+                self.close_connection = True
+                self.end_headers()
                 
-                history_json = json.dumps(history_data, ensure_ascii=False)
-                self.wfile.write(history_json.encode('utf-8'))
+                # 客户端每个心跳周期至少回一次pong，超过3个周期没有数据即视为断开；
+                # 同一超时也限制了向卡住的客户端写数据的时间
+                ping_interval = monitor.config.get('event_ping_interval', 10)
+                self.connection.settimeout(ping_interval * 3)
+                self.run_stream(self.websocket_stream, subscriber, ping_interval)
+            
+            def websocket_stream(self, subscriber, ping_interval):
+                """WebSocket连接：接收线程读取消息，另一线程发送推送事件"""
+                monitor = self.clipboard_monitor
+                ws = WebSocketConnection(self.rfile, self.wfile)
+                sender = threading.Thread(target=self.websocket_sender,
+                                          args=(ws, subscriber, ping_interval), daemon=True)
+                sender.start()
+                try:
+                    while True:
+                        message = ws.receive()
+                        if message is None:
+                            break
+                        self.handle_websocket_message(ws, message)
+                except (OSError, ValueError):
+                    pass
+                finally:
+                    monitor.events.unsubscribe(subscriber)
+                    ws.closed = True
+                    try:
+                        subscriber.put_nowait(None)
+                    except queue.Full:
+                        pass
+                    sender.join()
+            
+            def websocket_sender(self, ws, subscriber, ping_interval):
+                """WebSocket发送线程：转发推送事件并定时ping"""
+                monitor = self.clipboard_monitor
+                next_ping = time.monotonic() + ping_interval
+                try:
+                    while not ws.closed and monitor.server_running:
+                        try:
+                            message = subscriber.get(timeout=max(0, next_ping - time.monotonic()))
+                        except queue.Empty:
+                            message = ()
+                        if message is None:
+                            break
+                        if message:
+                            event, data = message
+                            if event == 'history':
+                                data = self.format_history_item(data, monitor.config.get('preview_length', 500))
+                            ws.send_json({'type': event, 'item': data})
+                        
+                        now = time.monotonic()
+                        if now - ws.last_seen > ping_interval * 3:
+                            logging.info("WebSocket客户端无响应，关闭连接")
+                            break
+                        if now >= next_ping:
+                            ws.send_frame(ws.OP_PING)
+                            next_ping = now + ping_interval
+                except OSError:
+                    pass
+                finally:
+                    ws.close()
+                    try:
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
             
+            def handle_websocket_message(self, ws, message):
+                """处理手机通过WebSocket发送的消息"""
+                opcode, payload = message
+                try:
+                    data = json.loads(payload.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    ws.send_json({'type': 'error', 'message': 'Invalid JSON format'})
+                    return
+                
+                if not isinstance(data, dict) or data.get('type') != 'set_clipboard':
+                    ws.send_json({'type': 'error', 'message': 'Unknown message type'})
+                    return
+                
+                text_content = str(data.get('text', '')).strip()
+                if not text_content:
+                    ws.send_json({'type': 'ack', 'success': False, 'message': 'Text content is empty'})
+                    return
+                
+                success = self.clipboard_monitor.set_clipboard_content(text_content)
+                ws.send_json({
+                    'type': 'ack',
+                    'success': success,
+                    'message': '剪贴板内容设置成功' if success else '设置剪贴板内容失败'
+                })
             
             def set_clipboard_from_mobile(self):
                 """处理手机发送的剪贴板内容"""
@@ -327,15 +3006,11 @@ class ClipboardMonitor:
                     success = self.clipboard_monitor.set_clipboard_content(text_content)
                     
                     # 返回响应
-                    self.send_response(200 if success else 500)
-                    self.send_header('Content-type', 'application/json; charset=utf-8')
-                    self.end_headers()
-                    
                     response = {
                         'success': success,
                         'message': '剪贴板内容设置成功' if success else '设置剪贴板内容失败'
                     }
-                    self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+                    self.send_json(response, 200 if success else 500)
                     
                 except json.JSONDecodeError:
                     self.send_error(400, 'Invalid JSON format')
@@ -345,9 +3020,7 @@ class ClipboardMonitor:
             
             def send_404(self):
                 """发送404响应"""
-                self.send_response(404)
-                self.end_headers()
-                self.wfile.write(b'Not Found')
+                self.send_body(b'Not Found', 'text/plain; charset=utf-8', 404)
         
         # 创建自定义处理器
         def create_handler(clipboard_monitor):
@@ -356,32 +3029,95 @@ class ClipboardMonitor:
             return handler
         
         try:
-            self.server = HTTPServer(('', port), create_handler(self))
+            self.server = self.create_http_server(port, create_handler(self))
             self.server_running = True
             
             def run_server():
-                logging.info(f"HTTP服务器启动在端口 {port}")
-                while self.server_running:
-                    self.server.handle_request()
+                logging.info(f"HTTP服务器启动在端口 {self.get_server_port()}")
+                self.server.serve_forever()
             
             self.server_thread = threading.Thread(target=run_server, daemon=True)
             self.server_thread.start()
             
         except Exception as e:
             logging.error(f"启动服务器失败: {e}")
+        self.notify_listeners('status')
+    
+    def create_http_server(self, port, handler):
+        """根据配置创建HTTP服务器引擎"""
+        engine = self.config.get('server_engine', 'threading')
+        max_workers = self.config.get('server_workers', 16)
+        idle_timeout = self.config.get('keep_alive_timeout', 15)
+        
+        if engine not in SERVER_ENGINES:
+            logging.warning(f"未知的服务器引擎 {engine}，使用 threading")
+            engine = 'threading'
+        
+        logging.info(f"HTTP服务器引擎: {engine}")
+        if engine == 'asyncio':
+            return AsyncioHTTPServer(('', port), handler, max_workers=max_workers,
+                                     idle_timeout=idle_timeout)
+        if engine == 'single':
+            return HTTPServer(('', port), handler)
+        return ThreadPoolHTTPServer(('', port), handler, max_workers=max_workers,
+                                    idle_timeout=idle_timeout)
     
     def stop_server(self):
         """停止HTTP服务器"""
         self.server_running = False
+        self.events.close()
+        self.address_resolver.stop()
         if self.server:
+            self.server.shutdown()
             self.server.server_close()
+            self.server = None
             logging.info("HTTP服务器已停止")
+        self.notify_listeners('status')
+    
+    def shutdown(self):
+        """退出前停止监控和服务器，并写完缓冲中的历史记录"""
+        self.stop_monitoring()
+        self.stop_server()
+        self.history_writer.close()
+        self.clipboard_history.close()
+        self.image_store.close()
     
-    def get_server_page(self):
+    def get_cached_page(self):
+        """返回渲染并压缩好的手机页面，端口或IP变化时重新生成"""
+        # 地址来自 address_resolver 的缓存，这里没有 socket 操作
+        key = (self.get_local_ip(), self.get_server_port(),
+               self.config.get('preview_length', 500))
+        with self._page_lock:
+            cache = self._page_cache
+            if cache is not None and cache[0] == key:
+                return cache[1]
+            page = PrecompressedBody(self.get_server_page(*key[:2]).encode('utf-8'),
+                                     'text/html; charset=utf-8')
+            logging.info(f"手机页面已生成: {len(page.variants['identity'])} 字节，"
+                         f"gzip {len(page.variants['gzip'])} 字节")
+            self._page_cache = (key, page)
+            return page
+    
+    def get_static_assets(self):
+        """返回静态资源表（样式、脚本和测试页面），只创建一次"""
+        with self._assets_lock:
+            if self.static_assets is None:
+                self.static_assets = StaticAssets.load()
+            return self.static_assets
+    
+    def invalidate_page_cache(self):
+        """端口等配置变化后丢弃缓存的页面"""
+        with self._page_lock:
+            self._page_cache = None
+    
+    def get_server_page(self, ip=None, port=None):
         """生成服务器页面HTML"""
-        ip = self.get_local_ip()
-        port = self.config.get('server_port', 9999)
+        ip = ip or self.get_local_ip()
+        port = port or self.get_server_port()
         server_url = f"http://{ip}:{port}"
+        preview_length = self.config.get('preview_length', 500)
+        # 样式和脚本是单独的静态资源，URL 带内容哈希
+        assets = self.get_static_assets()
         
         # 使用字符串拼接而不是f-string来避免语法错误
         html = """<!DOCTYPE html>
@@ -390,8 +3126,137 @@ class ClipboardMonitor:
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>剪贴板监控器 - 手机端</title>
-<style>
-        * {
+    <link rel="stylesheet" href=\"""" + assets.url('mobile.css') + """\">
+</head>
+<body data-preview-length=\"""" + str(preview_length) + """\">
+    <div class="container">
+        <div class="header" style="display: flex; align-items: center; justify-content: center; gap: 8px; margin-bottom: 15px;">
+                <div class="logo" style="font-size: 1.5em; margin: 0;">📋</div>
+                <h1 style="font-size: 1.2em; margin: 0; font-weight: 600;">剪贴板监控器</h1> 
+        </div>
+        
+        <div class="info-card">
+            <h3>📱 手机端连接信息</h3>
+            <div class="info-grid">
+                <div class="info-item">
+                    <div class="info-label">电脑IP地址</div>
+                    <div class="info-value">""" + ip + """</div>
+                </div>
+                <div class="info-item">
+                    <div class="info-label">端口号</div>
+                    <div class="info-value">""" + str(port) + """</div>
+                </div>
+                <div class="info-item">
+                    <div class="info-label">连接状态</div>
+                    <div class="info-value" id="connection-status">🟢 已连接</div>
+                </div>
+                <div class="info-item">
+                    <div class="info-label">最后更新</div>
+                    <div class="info-value" id="last-update">--:--</div>
+                </div>
+            </div>
+        </div>
+        
+        <div class="controls">
+            <button class="btn btn-primary" onclick="refreshHistory()">
+                🔄 刷新历史记录
+            </button>
+            <button class="btn btn-secondary" onclick="copyAllText()">
+                📋 复制全文
+            </button>
+        </div>
+        
+        <!-- 手机粘贴到电脑区域 -->
+        <div class="mobile-paste-section" style="margin: 20px 0;">
+            <div class="info-card">
+                <h3>📤 手机粘贴到电脑</h3>
+                <p style="margin: 10px 0; color: rgba(255,255,255,0.9); font-size: 0.9em;">
+                    在下方输入文字，点击发送即可将内容发送到电脑剪贴板
+                </p>
+                <div style="margin-top: 15px;">
+                    <textarea
+                        id="mobile-paste-input"
+                        placeholder="请输入要发送到电脑的文字..."
+                        style="
+                            width: 100%;
+                            min-height: 80px;
+                            padding: 12px;
+                            border: 2px solid rgba(255,255,255,0.3);
+                            border-radius: 8px;
+                            background: rgba(255,255,255,0.1);
+                            color: white;
+                            font-size: 1em;
+                            margin-bottom: 10px;
+                            resize: vertical;
+                        "
+                        maxlength="1000"
+                    ></textarea>
+                    <button class="btn btn-success" onclick="sendToComputer()" id="send-btn">
+                        📤 发送到电脑
+                    </button>
+                </div>
+            </div>
+        </div>
+        
+        <div class="history-container">
+            <div class="history-header">
+                <div class="history-title">📋 剪贴板历史记录</div>
+                <div class="history-count" id="history-count">0条</div>
+            </div>
+            <div class="history-list" id="history-container">
+                <div class="loading">等待加载历史记录...</div>
+            </div>
+        </div>
+    </div>
+    
+    <script src=\"""" + assets.url('mobile.js') + """\"></script>
+</body>
+</html>"""
+        return html
+
+    def generate_qr_code(self, server_url=None, box_size=10, border=4):
+        """生成二维码，默认使用首选地址"""
+        # 二维码模块只在生成时导入，无界面模式通常用不到
+        import qrcode
+        server_url = server_url or self.get_server_urls()[0]
+        
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(server_url)
+        qr.make(fit=True)
+        
+        return qr.make_image(fill_color="black", back_color="white")
+    
+    # 最多缓存的二维码数量（每个地址和尺寸一个）
+    QR_CACHE_SIZE = 16
+    
+    def get_qr_code(self, server_url=None, box_size=10, border=4):
+        """返回二维码 PNG（PrecompressedBody），按地址和渲染参数缓存"""
+        server_url = server_url or self.get_server_urls()[0]
+        key = (server_url, box_size, border)
+        with self._qr_lock:
+            png = self._qr_cache.get(key)
+            if png is not None:
+                self._qr_cache.move_to_end(key)
+                return png
+        
+        # 在锁外生成，较慢的生成不会阻塞其他地址的缓存命中
+        buffer = BytesIO()
+        self.generate_qr_code(server_url, box_size, border).save(buffer, format="PNG")
+        png = PrecompressedBody(buffer.getvalue(), 'image/png', compress=False)
+        with self._qr_lock:
+            self._qr_cache[key] = png
+            while len(self._qr_cache) > self.QR_CACHE_SIZE:
+                self._qr_cache.popitem(last=False)
+        return png
+
+
+# 手机页面的样式表，作为静态资源 /static/mobile.<哈希>.css 提供
+MOBILE_PAGE_CSS = """        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
@@ -541,6 +3406,18 @@ class ClipboardMonitor:
             font-size: 0.75em;
             font-weight: 500;
         }
+        .item-image {
+            display: block;
+            max-width: 100%;
+            max-height: 256px;
+            margin: 8px 0;
+            border-radius: 4px;
+            background: #f1f3f4;
+        }
+        a.action-btn {
+            display: inline-block;
+            text-decoration: none;
+        }
         .item-text {
             margin: 8px 0;
             line-height: 1.4;
@@ -664,102 +3541,27 @@ class ClipboardMonitor:
             .btn {
                 min-height: 44px;
                 padding: 12px 16px;
-                font-size: 0.95em;
-            }
-            .action-btn {
-                min-height: 36px;
-                padding: 8px 12px;
-                font-size: 0.85em;
-            }
-            .history-item {
-                padding: 16px 12px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header" style="display: flex; align-items: center; justify-content: center; gap: 8px; margin-bottom: 15px;">
-                <div class="logo" style="font-size: 1.5em; margin: 0;">📋</div>
-                <h1 style="font-size: 1.2em; margin: 0; font-weight: 600;">剪贴板监控器</h1> 
-        </div>
-        
-        <div class="info-card">
-            <h3>📱 手机端连接信息</h3>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">电脑IP地址</div>
-                    <div class="info-value">""" + ip + """</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">端口号</div>
-                    <div class="info-value">""" + str(port) + """</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">连接状态</div>
-                    <div class="info-value" id="connection-status">🟢 已连接</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">最后更新</div>
-                    <div class="info-value" id="last-update">--:--</div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="controls">
-            <button class="btn btn-primary" onclick="loadHistory()">
-                🔄 刷新历史记录
-            </button>
-            <button class="btn btn-secondary" onclick="copyAllText()">
-                📋 复制全文
-            </button>
-        </div>
-        
-        <!-- 手机粘贴到电脑区域 -->
-        <div class="mobile-paste-section" style="margin: 20px 0;">
-            <div class="info-card">
-                <h3>📤 手机粘贴到电脑</h3>
-                <p style="margin: 10px 0; color: rgba(255,255,255,0.9); font-size: 0.9em;">
-                    在下方输入文字，点击发送即可将内容发送到电脑剪贴板
-                </p>
-                <div style="margin-top: 15px;">
-                    <textarea
-                        id="mobile-paste-input"
-                        placeholder="请输入要发送到电脑的文字..."
-                        style="
-                            width: 100%;
-                            min-height: 80px;
-                            padding: 12px;
-                            border: 2px solid rgba(255,255,255,0.3);
-                            border-radius: 8px;
-                            background: rgba(255,255,255,0.1);
-                            color: white;
-                            font-size: 1em;
-                            margin-bottom: 10px;
-                            resize: vertical;
-                        "
-                        maxlength="1000"
-                    ></textarea>
-                    <button class="btn btn-success" onclick="sendToComputer()" id="send-btn">
-                        📤 发送到电脑
-                    </button>
-                </div>
-            </div>
-        </div>
-        
-        <div class="history-container">
-            <div class="history-header">
-                <div class="history-title">📋 剪贴板历史记录</div>
-                <div class="history-count" id="history-count">0条</div>
-            </div>
-            <div class="history-list" id="history-container">
-                <div class="loading">等待加载历史记录...</div>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        let clipboardHistory = [];
+                font-size: 0.95em;
+            }
+            .action-btn {
+                min-height: 36px;
+                padding: 8px 12px;
+                font-size: 0.85em;
+            }
+            .history-item {
+                padding: 16px 12px;
+            }
+        }
+"""
+
+# 手机页面的脚本，作为静态资源 /static/mobile.<哈希>.js 提供
+MOBILE_PAGE_JS = """        let clipboardHistory = [];
+        // 每页条数和列表中显示的最大字符数，长内容点击展开时再获取
+        const PAGE_SIZE = 30;
+        const PREVIEW_LENGTH = Number(document.body.dataset.previewLength) || 500;
+        let nextCursor = null;
+        let historyTotal = 0;
+        let loadingMore = false;
         
         function updateLastUpdate() {
             document.getElementById('last-update').textContent = new Date().toLocaleTimeString();
@@ -769,28 +3571,81 @@ class ClipboardMonitor:
             return new Date(timestamp).toLocaleString();
         }
         
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        }
+
         function createTextItem(item, index) {
+            const more = item.truncated
+                ? `<button class="action-btn" onclick="expandItem(${item.id})">📖 展开全文（${item.length}字）</button>`
+                : '';
             return `
-                <div class="history-item">
+                <div class="history-item" data-id="${item.id}">
                     <div class="item-header">
                         <span class="item-timestamp">${formatTimestamp(item.timestamp)}</span>
                         <span class="item-type">📝 文本</span>
                     </div>
-                    <div class="item-text">${item.content}</div>
-                    <button class="action-btn" onclick="copyText(\`${item.content.replace(/`/g, '\\`').replace(/\\$/g, '\\\\$')}\`)">📋 复制</button>
+                    <div class="item-text">${escapeHtml(item.content)}${item.truncated ? '…' : ''}</div>
+                    <button class="action-btn" onclick="copyItem(${item.id})">📋 复制</button>
+                    ${more}
                 </div>
             `;
         }
+
+        function createItem(item, index) {
+            return item.type === 'text' ? createTextItem(item, index) : createImageItem(item, index);
+        }
+
+        // 获取被截断记录的完整内容
+        function fetchFullItem(id) {
+            const item = clipboardHistory.find(existing => existing.id === id);
+            if (item && !item.truncated) {
+                return Promise.resolve(item);
+            }
+            return fetch(`/api/history/${id}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                });
+        }
+
+        function copyItem(id) {
+            fetchFullItem(id)
+                .then(item => copyText(item.content))
+                .catch(() => showToast('❌ 获取内容失败'));
+        }
+
+        function expandItem(id) {
+            fetchFullItem(id)
+                .then(full => {
+                    const index = clipboardHistory.findIndex(existing => existing.id === id);
+                    if (index >= 0) {
+                        clipboardHistory[index] = full;
+                    }
+                    const element = document.querySelector(`.history-item[data-id="${id}"]`);
+                    if (element) {
+                        element.outerHTML = createItem(full, index);
+                    }
+                })
+                .catch(() => showToast('❌ 获取内容失败'));
+        }
         
+        // 列表中只加载缩略图，点击或保存时才下载原图
         function createImageItem(item, index) {
             return `
-                <div class="history-item">
+                <div class="history-item" data-id="${item.id}">
                     <div class="item-header">
                         <span class="item-timestamp">${formatTimestamp(item.timestamp)}</span>
                         <span class="item-type">🖼️ 图片</span>
                     </div>
-                    <div class="item-text">图片文件: ${item.content}</div>
-                    <button class="action-btn" onclick="copyText('${item.content}')">📋 复制路径</button>
+                    <a href="${item.image}" target="_blank">
+                        <img class="item-image" src="${item.thumbnail}" loading="lazy" alt="剪贴板图片">
+                    </a>
+                    <a class="action-btn" href="${item.image}" download="clipboard-${item.id}.png">💾 保存原图</a>
                 </div>
             `;
         }
@@ -861,30 +3716,151 @@ class ClipboardMonitor:
             setTimeout(() => document.body.removeChild(toast), 1000);
         }
         
-        function loadHistory() {
+        function renderHistory() {
             const container = document.getElementById('history-container');
-            container.innerHTML = '<div class="loading">🔄 正在加载历史记录...</div>';
+            const data = clipboardHistory;
+            
+            if (data.length === 0) {
+                container.innerHTML = `
+                    <div class="empty-state">
+                        <div class="empty-icon">📋</div>
+                        <h3>暂无历史记录</h3>
+                        <p>开始在电脑上复制内容，这里会显示历史记录</p>
+                    </div>
+                `;
+            } else {
+                container.innerHTML = data.map(createItem).join('') +
+                    (nextCursor !== null ? '<div class="loading" id="history-more">⬇️ 下拉加载更多</div>' : '');
+            }
+            updateHistoryCount();
+        }
+        
+        function updateHistoryCount() {
+            document.getElementById('history-count').textContent = historyTotal + '条';
+        }
+        
+        // 无限滚动：滚动到列表底部时加载下一页
+        function loadMoreHistory() {
+            if (loadingMore || nextCursor === null) {
+                return;
+            }
             
-            fetch('/api/history')
+            loadingMore = true;
+            fetch(`/api/history?limit=${PAGE_SIZE}&before=${nextCursor}&preview=${PREVIEW_LENGTH}`)
                 .then(response => response.json())
-                .then(data => {
-                    clipboardHistory = data;
+                .then(page => {
+                    const known = new Set(clipboardHistory.map(item => item.id));
+                    const items = page.items.filter(item => !known.has(item.id));
+                    clipboardHistory = clipboardHistory.concat(items);
+                    nextCursor = page.next;
+                    historyTotal = page.total;
                     
-                    if (data.length === 0) {
-                        container.innerHTML = `
-                            <div class="empty-state">
-                                <div class="empty-icon">📋</div>
-                                <h3>暂无历史记录</h3>
-                                <p>开始在电脑上复制内容，这里会显示历史记录</p>
-                            </div>
-                        `;
-                    } else {
-                        document.getElementById('history-count').textContent = data.length + '条';
-                        
-                        container.innerHTML = data.map((item, index) =>
-                            item.type === 'text' ? createTextItem(item, index) : createImageItem(item, index)
-                        ).join('');
+                    // 只追加新的一页，不重建已有的列表
+                    const more = document.getElementById('history-more');
+                    if (more) {
+                        more.insertAdjacentHTML('beforebegin', items.map(createItem).join(''));
+                        if (nextCursor === null) {
+                            more.remove();
+                        }
+                    }
+                    updateHistoryCount();
+                })
+                .catch(error => console.error('加载更多失败:', error))
+                .finally(() => {
+                    loadingMore = false;
+                });
+        }
+        
+        // 增量同步：只拉取比 latestSeq 新的记录，没有变化时服务器返回304
+        let latestSeq = null;
+        let historyEtag = null;
+        
+        // 重新复制的内容会以新的id移到最前（history_move_to_top），按内容去掉旧的那条
+        function sameContent(a, b) {
+            return a.type === b.type && a.content === b.content && (a.length || 0) === (b.length || 0);
+        }
+        
+        function mergeHistory(delta) {
+            const received = new Set(delta.items.map(item => item.id));
+            clipboardHistory = delta.items
+                .concat(clipboardHistory.filter(item =>
+                    !received.has(item.id) && !delta.items.some(newer => sameContent(newer, item))))
+                .filter(item => item.id >= delta.oldest);
+            latestSeq = delta.latest;
+            historyTotal = delta.total;
+            renderHistory();
+        }
+        
+        function addPushedItem(item) {
+            if (clipboardHistory.some(existing => existing.id === item.id)) {
+                return;
+            }
+            const moved = clipboardHistory.find(existing => sameContent(existing, item));
+            if (moved) {
+                clipboardHistory = clipboardHistory.filter(existing => existing !== moved);
+                historyTotal -= 1;
+                const element = document.querySelector(`.history-item[data-id="${moved.id}"]`);
+                if (element) {
+                    element.remove();
+                }
+            }
+            clipboardHistory.unshift(item);
+            latestSeq = Math.max(latestSeq || 0, item.id);
+            historyTotal += 1;
+            if (clipboardHistory.length === 1) {
+                renderHistory();
+            } else {
+                // 只在顶部插入新记录
+                document.getElementById('history-container')
+                    .insertAdjacentHTML('afterbegin', createItem(item, 0));
+                updateHistoryCount();
+            }
+            updateLastUpdate();
+        }
+        
+        function refreshHistory() {
+            if (latestSeq === null) {
+                loadHistory();
+                return;
+            }
+            
+            const headers = historyEtag ? {'If-None-Match': historyEtag} : {};
+            fetch(`/api/history?since=${latestSeq}&preview=${PREVIEW_LENGTH}`, {cache: 'no-store', headers: headers})
+                .then(response => {
+                    if (response.status === 304) {
+                        return null;
+                    }
+                    historyEtag = response.headers.get('ETag');
+                    return response.json();
+                })
+                .then(delta => {
+                    if (delta) {
+                        mergeHistory(delta);
                     }
+                    updateLastUpdate();
+                    document.getElementById('connection-status').textContent = '🟢 已连接';
+                })
+                .catch(error => {
+                    console.error('刷新失败:', error);
+                    document.getElementById('connection-status').textContent = '🔴 连接失败';
+                });
+        }
+        
+        function loadHistory() {
+            const container = document.getElementById('history-container');
+            container.innerHTML = '<div class="loading">🔄 正在加载历史记录...</div>';
+            
+            fetch(`/api/history?limit=${PAGE_SIZE}&preview=${PREVIEW_LENGTH}`, {cache: 'no-store'})
+                .then(response => {
+                    historyEtag = response.headers.get('ETag');
+                    return response.json();
+                })
+                .then(page => {
+                    clipboardHistory = page.items;
+                    nextCursor = page.next;
+                    latestSeq = page.latest;
+                    historyTotal = page.total;
+                    renderHistory();
                     
                     updateLastUpdate();
                     document.getElementById('connection-status').textContent = '🟢 已连接';
@@ -956,7 +3932,10 @@ class ClipboardMonitor:
             // 监听滚动事件，优化性能
             let ticking = false;
             function updateScroll() {
-                // 这里可以添加滚动相关的优化逻辑
+                // 接近底部时加载下一页
+                if (historyList.scrollTop + historyList.clientHeight >= historyList.scrollHeight - 200) {
+                    loadMoreHistory();
+                }
                 ticking = false;
             }
             
@@ -970,10 +3949,124 @@ class ClipboardMonitor:
             }
         }
         
+        // 订阅服务器推送的新记录（/api/events），不再需要反复拉取完整历史
+        let eventsActive = false;
+        
+        function connectEvents() {
+            if (!window.EventSource) {
+                return;
+            }
+            
+            let reconnecting = false;
+            const source = new EventSource('/api/events');
+            source.addEventListener('history', event => addPushedItem(JSON.parse(event.data)));
+            // 推送积压过多时服务器会要求重新加载完整历史
+            source.addEventListener('reset', () => loadHistory());
+            source.onopen = () => {
+                eventsActive = true;
+                document.getElementById('connection-status').textContent = '🟢 已连接';
+                // 断线期间的记录收不到推送，重连后补齐
+                if (reconnecting) {
+                    refreshHistory();
+                }
+            };
+            source.onerror = () => {
+                eventsActive = false;
+                reconnecting = true;
+                // 服务器拒绝（如连接数已满）时浏览器不会自动重连，退回手动刷新
+                document.getElementById('connection-status').textContent =
+                    source.readyState === EventSource.CLOSED ? '🟡 推送不可用' : '🟡 重新连接中';
+            };
+        }
+        
+        // WebSocket双向同步（/api/ws）：一个长连接同时接收推送和发送文本
+        let socket = null;
+        let pendingAcks = [];
+        
+        function connectSocket(reconnecting) {
+            const ws = new WebSocket(`ws://${location.host}/api/ws`);
+            let opened = false;
+            
+            ws.onopen = () => {
+                opened = true;
+                socket = ws;
+                eventsActive = true;
+                document.getElementById('connection-status').textContent = '🟢 已连接';
+                if (reconnecting) {
+                    refreshHistory();
+                }
+            };
+            ws.onmessage = event => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'history') {
+                    addPushedItem(message.item);
+                } else if (message.type === 'reset') {
+                    loadHistory();
+                } else if (message.type === 'ack' && pendingAcks.length > 0) {
+                    pendingAcks.shift().resolve(message);
+                }
+            };
+            ws.onclose = () => {
+                socket = null;
+                eventsActive = false;
+                pendingAcks.forEach(pending => pending.reject(new Error('WebSocket closed')));
+                pendingAcks = [];
+                if (!opened && !reconnecting) {
+                    // WebSocket不可用（如被代理拦截），退回事件流
+                    connectEvents();
+                    return;
+                }
+                document.getElementById('connection-status').textContent = '🟡 重新连接中';
+                setTimeout(() => connectSocket(true), 3000);
+            };
+        }
+        
+        function connectSync() {
+            if (window.WebSocket) {
+                connectSocket(false);
+            } else {
+                connectEvents();
+            }
+        }
+        
+        // 发送文本：优先走WebSocket，否则使用POST接口
+        function postClipboard(text) {
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                return new Promise((resolve, reject) => {
+                    pendingAcks.push({resolve, reject});
+                    socket.send(JSON.stringify({type: 'set_clipboard', text: text}));
+                });
+            }
+            
+            return fetch('/api/set_clipboard', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    text: text
+                })
+            })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            });
+        }
+        
         // 页面加载完成后增强触摸体验
         window.addEventListener('load', () => {
             enhanceTouchExperience();
             optimizeScrolling();
+            loadHistory();
+            connectSync();
+            // 推送不可用时定期增量刷新，没有新记录只需一个304响应
+            setInterval(() => {
+                if (!eventsActive) {
+                    refreshHistory();
+                }
+            }, 5000);
         });
         
         // 发送文本到电脑剪贴板 - 增强版本
@@ -1002,21 +4095,7 @@ class ClipboardMonitor:
             sendBtn.style.background = 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)';
             sendBtn.style.transform = 'scale(0.98)';
             
-            fetch('/api/set_clipboard', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    text: text
-                })
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-                return response.json();
-            })
+            postClipboard(text)
             .then(data => {
                 if (data.success) {
                     showToast('✅ 文字已发送到电脑剪贴板');
@@ -1030,8 +4109,10 @@ class ClipboardMonitor:
                         sendBtn.innerHTML = originalText;
                     }, 1000);
                     
-                    // 重新加载历史记录以显示新内容
-                    setTimeout(loadHistory, 1000);
+                    // 没有事件推送时重新加载历史记录以显示新内容
+                    if (!eventsActive) {
+                        setTimeout(refreshHistory, 1000);
+                    }
                 } else {
                     showToast(`❌ 发送失败: ${data.message}`);
                     sendBtn.style.background = '#dc3545';
@@ -1067,35 +4148,247 @@ class ClipboardMonitor:
                 sendToComputer();
             }
         });
-    </script>
+"""
+
+# 找不到 mobile_test.html 时使用的测试页面
+FALLBACK_TEST_PAGE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>手机界面兼容性测试</title>
+    <style>
+        body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; background-color: #f5f5f5; margin: 0; padding: 20px; }
+        .container { background: white; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
+        .test-result { margin: 10px 0; padding: 10px; background: #d4edda; border-left: 4px solid #28a745; border-radius: 4px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>📱 剪贴板监控器手机界面兼容性测试</h1>
+        <div class="test-result">
+            ✅ 测试文件未找到，但主界面已优化完成！<br>
+            ✅ 支持320px-768px屏幕宽度<br>
+            ✅ 触摸优化：按钮最小高度44px<br>
+            ✅ 字体适配：根据不同屏幕调整大小<br>
+            ✅ 交互反馈：触摸点击有视觉反馈<br>
+            ✅ 平滑滚动：支持触摸滚动<br>
+            <br>
+            <a href="/" style="display: inline-block; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 6px;">🏠 返回主界面</a>
+        </div>
+    </div>
 </body>
 </html>"""
-        return html
 
-    def generate_qr_code(self):
-        """生成二维码"""
-        ip = self.get_local_ip()
-        port = self.config.get('server_port',9999)
-        server_url = f"http://{ip}:{port}"
+
+class StaticAssets:
+    """内存中的静态资源表：URL 中带内容哈希，内容变化时 URL 也变化
+
+    资源在创建时一次性编码和压缩，请求时只查表。
+    """
+
+    def __init__(self):
+        self._assets = {}  # URL -> PrecompressedBody
+        self._urls = {}    # 文件名 -> URL
+        self.test_page = None
+
+    def add(self, name, body, content_type):
+        """加入资源，返回其 URL"""
+        asset = PrecompressedBody(body, content_type)
+        stem, _, extension = name.rpartition('.')
+        url = f'/static/{stem}.{asset.etag[:12]}.{extension}'
+        self._assets[url] = asset
+        self._urls[name] = url
+        return url
+
+    def url(self, name):
+        return self._urls[name]
+
+    def get(self, url):
+        return self._assets.get(url)
+
+    @classmethod
+    def load(cls, test_page_path='mobile_test.html'):
+        """创建手机页面用到的全部资源"""
+        assets = cls()
+        assets.add('mobile.css', MOBILE_PAGE_CSS.encode('utf-8'), 'text/css; charset=utf-8')
+        assets.add('mobile.js', MOBILE_PAGE_JS.encode('utf-8'), 'application/javascript; charset=utf-8')
+        try:
+            with open(test_page_path, 'rb') as f:
+                test_page = f.read()
+        except FileNotFoundError:
+            test_page = FALLBACK_TEST_PAGE.encode('utf-8')
+        assets.test_page = PrecompressedBody(test_page, 'text/html; charset=utf-8')
+        return assets
+
+
+class HistoryListView:
+    """虚拟化的历史记录列表，从新到旧显示
+
+    只保存记录字典的引用，文本框中只放当前可见的几行；滚动时按行重新渲染
+    可见部分，所以渲染开销和历史记录的条数、内容长度无关。每条只显示截断的
+    预览，点击“展开”才显示完整内容。
+    """
+
+    PREVIEW_CHARS = 120
+    # 展开时最多显示的字符数，更长的内容请复制后查看
+    EXPAND_LIMIT = 20000
+
+    def __init__(self, master, height=15, width=80, image_path=None):
+        self.image_path = image_path  # 图片哈希 -> 文件路径
+        self.frame = ttk.Frame(master)
+        self.text = tk.Text(self.frame, height=height, width=width, wrap=tk.WORD, cursor='arrow')
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
         
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(server_url)
-        qr.make(fit=True)
+        self.text.tag_configure('header', foreground='gray')
+        self.text.tag_configure('toggle', foreground='blue', underline=True)
+        self.text.tag_bind('toggle', '<Button-1>', self.on_toggle)
+        self.text.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.text.bind('<Button-4>', lambda e: self.on_mouse_wheel(e, -1))
+        self.text.bind('<Button-5>', lambda e: self.on_mouse_wheel(e, 1))
+        self.text.bind('<Prior>', lambda e: self.yview('scroll', -1, 'pages'))
+        self.text.bind('<Next>', lambda e: self.yview('scroll', 1, 'pages'))
+        self.text.bind('<Configure>', lambda e: self.render())
         
-        return qr.make_image(fill_color="black", back_color="white")
+        self.items = []        # 记录字典，从新到旧
+        self.first = 0         # 第一条可见记录的位置
+        self.expanded = set()  # 展开的记录 id
+        self.message = "暂无历史记录"
+        self.text.configure(state=tk.DISABLED)
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def set_items(self, items, message="暂无历史记录"):
+        """替换全部记录并回到顶部"""
+        self.items = list(items)
+        self.first = 0
+        self.expanded.clear()
+        self.message = message
+        self.render()
+
+    def prepend(self, new_items, max_items=None):
+        """在最前面加入新记录（new_items 从新到旧），超过 max_items 时去掉最旧的"""
+        if not new_items:
+            return
+        self.items[0:0] = new_items
+        # 用户正在往下看时保持当前看到的记录不动
+        if self.first > 0:
+            self.first += len(new_items)
+        if max_items is not None:
+            del self.items[max_items:]
+        self.first = min(self.first, max(len(self.items) - 1, 0))
+        self.render()
+
+    def visible_rows(self):
+        """可见区域大约能放下的记录数（每条至少占两行）"""
+        line_height = max(self.text.tk.call('font', 'metrics', self.text['font'], '-linespace'), 1)
+        lines = self.text.winfo_height() // line_height
+        if lines <= 1:
+            lines = int(self.text['height'])
+        return max(lines // 2 + 1, 1)
+
+    def yview(self, *args):
+        """滚动条回调：按记录为单位滚动"""
+        if not self.items:
+            return
+        rows = self.visible_rows()
+        if args[0] == 'moveto':
+            first = int(float(args[1]) * len(self.items))
+        else:
+            first = self.first + int(args[1]) * (rows if args[2] == 'pages' else 1)
+        first = min(max(first, 0), max(len(self.items) - rows + 1, 0))
+        if first != self.first:
+            self.first = first
+            self.render()
+        return 'break'
+
+    def on_mouse_wheel(self, event, direction=None):
+        if direction is None:
+            direction = -1 if event.delta > 0 else 1
+        # 展开的长内容超出可见区域时，先在文本框内滚动
+        top, bottom = self.text.yview()
+        if (direction > 0 and bottom < 1.0) or (direction < 0 and top > 0.0):
+            self.text.yview_scroll(direction * 3, 'units')
+            return 'break'
+        return self.yview('scroll', direction * 3, 'units')
+
+    def on_toggle(self, event):
+        """点击“展开/收起”"""
+        for tag in self.text.tag_names(tk.CURRENT):
+            if tag.startswith('item-'):
+                item_id = int(tag[5:])
+                if item_id in self.expanded:
+                    self.expanded.discard(item_id)
+                else:
+                    self.expanded.add(item_id)
+                self.render()
+                return
+
+    def render(self):
+        """只渲染可见的记录"""
+        text = self.text
+        text.configure(state=tk.NORMAL)
+        text.delete('1.0', tk.END)
+        for tag in text.tag_names():
+            if tag.startswith('item-'):
+                text.tag_delete(tag)
+        
+        if not self.items:
+            text.insert(tk.END, self.message)
+            last = 0
+        else:
+            last = min(self.first + self.visible_rows(), len(self.items))
+            for index in range(self.first, last):
+                self.insert_item(index, self.items[index])
+        text.configure(state=tk.DISABLED)
+        
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.first / total, last / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def insert_item(self, index, item):
+        text = self.text
+        content = item['content']
+        if item['type'] == 'image':
+            path = self.image_path(content) if self.image_path else content
+            text.insert(tk.END, f"[{index + 1}] [{item['timestamp']}] 🖼️ 图片\n", 'header')
+            text.insert(tk.END, f"文件: {path}\n" + "-" * 50 + "\n")
+            return
+        text.insert(tk.END, f"[{index + 1}] [{item['timestamp']}] 📝 文本"
+                            f"  {len(content)} 字符\n", 'header')
+        label = "内容"
+        
+        toggle_tags = ('toggle', f"item-{item['id']}")
+        if item['id'] in self.expanded:
+            text.insert(tk.END, f"{label}: {content[:self.EXPAND_LIMIT]}")
+            if len(content) > self.EXPAND_LIMIT:
+                text.insert(tk.END, f"…（仅显示前 {self.EXPAND_LIMIT} 字符）")
+            text.insert(tk.END, " ")
+            text.insert(tk.END, "[收起]", toggle_tags)
+        else:
+            # 预览只取开头一段，换行显示为空格
+            preview = ' '.join(content[:self.PREVIEW_CHARS * 2].split())[:self.PREVIEW_CHARS]
+            text.insert(tk.END, f"{label}: {preview}")
+            if len(content) > self.PREVIEW_CHARS or '\n' in content.strip():
+                text.insert(tk.END, "… ")
+                text.insert(tk.END, "[展开]", toggle_tags)
+        text.insert(tk.END, "\n" + "-" * 50 + "\n")
 
 
 class ClipboardGUI:
     """剪贴板监控器GUI界面"""
     
-    def __init__(self):
+    def __init__(self, config_file='config.json'):
         """初始化GUI"""
-        self.monitor = ClipboardMonitor()
+        import_gui_modules()
+        self.monitor = ClipboardMonitor(config_file)
         
         # 创建主窗口
         self.window = tk.Tk()
@@ -1106,9 +4399,16 @@ class ClipboardGUI:
         # 创建GUI组件
         self.create_widgets()
         
+        # 监控线程和服务器线程的状态变化经事件总线交给Tk线程
+        self.event_bus = GUIEventBus(self.monitor.max_history)
+        self.monitor.listeners.append(self.event_bus.post)
+        # 后台线程的结果回调 (函数, 参数)，同样每帧在Tk线程中执行
+        self.pending_calls = queue.SimpleQueue()
+        
         # 更新状态显示
         self.update_status()
         self.update_history_display()
+        self.window.after(self.FRAME_INTERVAL, self.process_events)
         
         # 启动时自动执行的功能
         self.auto_start_features()
@@ -1161,8 +4461,14 @@ class ClipboardGUI:
         
         # 检查间隔
         ttk.Label(config_frame, text="检查间隔(秒):").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        interval_frame = ttk.Frame(config_frame)
+        interval_frame.grid(row=1, column=1, sticky=tk.W, padx=(10, 0), pady=(5, 0))
         self.interval_var = tk.StringVar(value=str(self.monitor.check_interval))
-        ttk.Entry(config_frame, textvariable=self.interval_var, width=10).grid(row=1, column=1, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        ttk.Entry(interval_frame, textvariable=self.interval_var, width=10).pack(side=tk.LEFT)
+        # 自适应轮询空闲时逐步延长到的最长间隔
+        ttk.Label(interval_frame, text="空闲时最长(秒):").pack(side=tk.LEFT, padx=(10, 0))
+        self.max_interval_var = tk.StringVar(value=str(self.monitor.config.get('max_check_interval', 3.0)))
+        ttk.Entry(interval_frame, textvariable=self.max_interval_var, width=10).pack(side=tk.LEFT, padx=(5, 0))
         
         # 自动保存
         self.auto_save_var = tk.BooleanVar(value=self.monitor.auto_save)
@@ -1190,12 +4496,23 @@ class ClipboardGUI:
         history_frame = ttk.LabelFrame(main_frame, text="剪贴板历史记录", padding="10")
         history_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         
-        # 历史记录显示
-        self.history_text = scrolledtext.ScrolledText(history_frame, height=15, width=80)
-        self.history_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # 搜索框：输入停顿后按关键词过滤历史记录
+        search_frame = ttk.Frame(history_frame)
+        search_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+        ttk.Label(search_frame, text="🔍 搜索:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        search_entry.bind('<KeyRelease>', self.schedule_search)
+        self.search_job = None
+        
+        # 历史记录显示（虚拟化列表，只渲染可见的记录）
+        self.history_view = HistoryListView(history_frame, height=15, width=80,
+                                            image_path=self.monitor.image_store.image_path)
+        self.history_view.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # 清空历史记录按钮
-        ttk.Button(history_frame, text="🗑️ 清空历史记录", command=self.clear_history).grid(row=1, column=0, pady=(10, 0))
+        ttk.Button(history_frame, text="🗑️ 清空历史记录", command=self.clear_history).grid(row=2, column=0, pady=(10, 0))
         
         # 配置行列权重
         self.window.columnconfigure(0, weight=1)
@@ -1203,36 +4520,67 @@ class ClipboardGUI:
         main_frame.columnconfigure(2, weight=1)
         main_frame.rowconfigure(4, weight=1)
         history_frame.columnconfigure(0, weight=1)
-        history_frame.rowconfigure(0, weight=1)
+        history_frame.rowconfigure(1, weight=1)
     
     def update_status(self):
         """更新状态显示"""
         status = f"监控状态: {'🟢 运行中' if self.monitor.monitoring else '🔴 已停止'} | "
         status += f"服务器: {'🟢 运行中' if self.monitor.server_running else '🔴 已停止'} | "
+        if self.monitor.server_running:
+            status += f"手机连接: {self.monitor.events.subscriber_count} | "
         status += f"历史记录: {len(self.monitor.clipboard_history)} 条"
         self.status_var.set(status)
     
     def update_history_display(self):
-        """更新历史记录显示"""
-        self.history_text.delete(1.0, tk.END)
-        
-        if not self.monitor.clipboard_history:
-            self.history_text.insert(tk.END, "暂无历史记录")
+        """重新加载历史记录显示（启动、搜索和清空时）"""
+        keywords = self.search_var.get().strip()
+        if keywords:
+            history = self.monitor.clipboard_history.search(keywords, 200)
+            self.history_view.set_items(history, f"没有找到包含“{keywords}”的记录")
         else:
-            for i, item in enumerate(self.monitor.clipboard_history):
-                timestamp = item['timestamp']
-                content_type = "📝 文本" if item['type'] == 'text' else "🖼️ 图片"
-                content = item['content']
-                
-                self.history_text.insert(tk.END, f"[{i+1}] [{timestamp}] {content_type}\n")
-                if item['type'] == 'text':
-                    self.history_text.insert(tk.END, f"内容: {content}\n")
-                else:
-                    self.history_text.insert(tk.END, f"文件: {content}\n")
-                self.history_text.insert(tk.END, "-" * 50 + "\n")
-        
-        # 滚动到底部
-        self.history_text.see(tk.END)
+            self.history_view.set_items(self.monitor.clipboard_history.snapshot())
+    
+    # 每帧的间隔（毫秒）：其他线程的事件每帧最多引起一次重绘
+    FRAME_INTERVAL = 16
+    
+    def process_events(self):
+        """每帧取出一次事件总线上积累的事件，合并后更新界面"""
+        batch = self.event_bus.drain()
+        if batch is not None:
+            new_items, events = batch
+            if 'reset' in events or new_items:
+                self.apply_history_changes(new_items, 'reset' in events)
+            self.update_status()
+        while True:
+            try:
+                func, args = self.pending_calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        self.window.after(self.FRAME_INTERVAL, self.process_events)
+    
+    def apply_history_changes(self, new_items, reset):
+        """把新记录加到列表最前面；清空或无法增量更新时重新加载"""
+        history = self.monitor.clipboard_history
+        if self.search_var.get().strip():
+            # 搜索结果可能变化，按搜索框重新搜索
+            self.schedule_search()
+        elif reset or history.move_to_top:
+            # 移到最前会删除旧位置的记录，直接按快照重新加载
+            self.update_history_display()
+        else:
+            self.history_view.prepend(new_items[::-1], len(history))
+    
+    def schedule_search(self, event=None):
+        """输入停顿300毫秒后再搜索，避免每次按键都刷新"""
+        if self.search_job is not None:
+            self.window.after_cancel(self.search_job)
+        self.search_job = self.window.after(300, self.run_search)
+    
+    def run_search(self):
+        """按搜索框内容刷新历史记录显示"""
+        self.search_job = None
+        self.update_history_display()
     
     def toggle_monitoring(self):
         """切换监控状态"""
@@ -1244,8 +4592,6 @@ class ClipboardGUI:
             self.monitor.start_monitoring()
             self.start_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
-        
-        self.update_status()
     
     def toggle_server(self):
         """切换服务器状态"""
@@ -1257,49 +4603,78 @@ class ClipboardGUI:
             self.monitor.start_server()
             self.start_server_btn.config(state=tk.DISABLED)
             self.stop_server_btn.config(state=tk.NORMAL)
-        
-        self.update_status()
     
     def show_qr_code(self):
         """显示二维码"""
         try:
-            qr_image = self.monitor.generate_qr_code()
-            
             # 创建二维码窗口
             qr_window = tk.Toplevel(self.window)
             qr_window.title("📱 手机连接二维码")
-            qr_window.geometry("400x500")
+            qr_window.geometry("400x560")
 
+            self.fill_qr_window(qr_window)
+            
+        except Exception as e:
+            messagebox.showerror("错误", f"生成二维码失败: {e}")
+    
+    def fill_qr_window(self, qr_window):
+        """在二维码窗口中显示二维码和连接信息，有多个地址时可切换"""
+        urls = self.monitor.get_server_urls()
+        qr_label = ttk.Label(qr_window, text="⏳ 正在生成二维码...")
+        qr_label.pack(pady=20)
+        
+        def show_image(png):
+            if not qr_label.winfo_exists():
+                return  # 生成完成前窗口已关闭
             # 转换为Tkinter可显示的格式
-            img_buffer = BytesIO()
-            qr_image.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            tk_img = ImageTk.PhotoImage(data=img_buffer.read())
-
-            # 显示二维码
-            qr_label = ttk.Label(qr_window, image=tk_img)
+            tk_img = ImageTk.PhotoImage(data=png.variants['identity'])
+            qr_label.config(image=tk_img, text='')
             qr_label.image = tk_img  # 保持引用
-            qr_label.pack(pady=20)
-            
-            # 显示连接信息
-            ip = self.monitor.get_local_ip()
-            port = self.monitor.config.get('server_port', 9999)
-            server_url = f"http://{ip}:{port}"
-            
-            info_text = f"""
+        
+        def show(url):
+            self.load_qr_code(url, show_image)
+        
+        show(urls[0])
+        
+        # 电脑连着多个网络时，让用户选择手机所在网络的地址
+        if len(urls) > 1:
+            url_var = tk.StringVar(value=urls[0])
+            url_combo = ttk.Combobox(qr_window, textvariable=url_var, values=urls,
+                                     state='readonly', width=30)
+            url_combo.pack()
+            url_combo.bind('<<ComboboxSelected>>',
+                           lambda e: show(url_var.get()))
+        
+        # 显示连接信息
+        port = self.monitor.get_server_port()
+        addresses = "\n".join(f"访问地址: {url}" for url in urls)
+        info_text = f"""
 连接信息:
-IP地址: {ip}
 端口号: {port}
-访问地址: {server_url}
+{addresses}
 
 请确保手机和电脑在同一个Wi-Fi网络下
 使用手机浏览器扫描上方二维码即可访问
 """
-            info_label = ttk.Label(qr_window, text=info_text, justify=tk.CENTER)
-            info_label.pack(pady=10)
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"生成二维码失败: {e}")
+        info_label = ttk.Label(qr_window, text=info_text, justify=tk.CENTER)
+        info_label.pack(pady=10)
+    
+    def load_qr_code(self, server_url, callback):
+        """在后台线程生成（或从缓存读取）二维码，完成后在Tk线程中调用 callback(png)
+
+        Tk 不是线程安全的，后台线程不能调用 window.after 或 messagebox，
+        结果放进 pending_calls，由 process_events 在Tk线程中处理。
+        """
+        def generate():
+            try:
+                png = self.monitor.get_qr_code(server_url)
+            except Exception as e:
+                logging.error(f"生成二维码失败: {e}")
+                self.pending_calls.put((messagebox.showerror, ("错误", f"生成二维码失败: {e}")))
+                return
+            self.pending_calls.put((callback, (png,)))
+        
+        threading.Thread(target=generate, daemon=True).start()
     
     def auto_start_features(self):
         """启动时自动执行的功能"""
@@ -1340,42 +4715,14 @@ IP地址: {ip}
     def show_qr_code_non_blocking(self):
         """非阻塞方式显示二维码"""
         try:
-            qr_image = self.monitor.generate_qr_code()
-            
             # 创建二维码窗口
             qr_window = tk.Toplevel(self.window)
             qr_window.title("📱 手机连接二维码")
-            qr_window.geometry("400x500")
+            qr_window.geometry("400x560")
             qr_window.transient(self.window)  # 设置为临时窗口
             qr_window.grab_set()  # 模态窗口
             
-            # 转换为Tkinter可显示的格式
-            img_buffer = BytesIO()
-            qr_image.save(img_buffer, format="PNG")
-            img_buffer.seek(0)
-            tk_img = ImageTk.PhotoImage(data=img_buffer.read())
-
-            # 显示二维码
-            qr_label = ttk.Label(qr_window, image=tk_img)
-            qr_label.image = tk_img  # 保持引用
-            qr_label.pack(pady=20)
-            
-            # 显示连接信息
-            ip = self.monitor.get_local_ip()
-            port = self.monitor.config.get('server_port', 9999)
-            server_url = f"http://{ip}:{port}"
-            
-            info_text = f"""
-连接信息:
-IP地址: {ip}
-端口号: {port}
-访问地址: {server_url}
-
-请确保手机和电脑在同一个Wi-Fi网络下
-使用手机浏览器扫描上方二维码即可访问
-"""
-            info_label = ttk.Label(qr_window, text=info_text, justify=tk.CENTER)
-            info_label.pack(pady=10)
+            self.fill_qr_window(qr_window)
             
             # 添加关闭按钮
             close_btn = ttk.Button(qr_window, text="✅ 知道了", command=qr_window.destroy)
@@ -1394,7 +4741,8 @@ IP地址: {ip}
         """保存配置"""
         try:
             self.monitor.save_path = self.save_path_var.get()
-            self.monitor.check_interval = float(self.interval_var.get())
+            self.monitor.set_check_interval(float(self.interval_var.get()),
+                                            float(self.max_interval_var.get()))
             self.monitor.auto_save = self.auto_save_var.get()
             self.monitor.config['server_port'] = int(self.port_var.get())
             self.monitor.config['auto_start_monitoring'] = self.auto_start_monitoring_var.get()
@@ -1409,37 +4757,91 @@ IP地址: {ip}
     def clear_history(self):
         """清空历史记录"""
         if messagebox.askyesno("确认", "确定要清空所有历史记录吗？"):
-            self.monitor.clipboard_history.clear()
+            self.monitor.clear_history()
             self.update_history_display()
             messagebox.showinfo("成功", "历史记录已清空")
     
     def on_closing(self):
         """窗口关闭事件"""
         if messagebox.askokcancel("退出", "确定要退出剪贴板监控器吗？"):
-            self.monitor.stop_monitoring()
-            self.monitor.stop_server()
+            self.monitor.shutdown()
             self.window.destroy()
     
     def run(self):
         """运行GUI"""
         self.window.mainloop()
 
-def main():
+def run_headless(config_file='config.json'):
+    """无界面模式：只运行剪贴板监控和HTTP服务器，收到 SIGTERM/SIGINT 后退出
+
+    返回进程退出码：服务器启动失败（如端口被占用）时为1。
+    """
+    monitor = ClipboardMonitor(config_file)
+    stop = threading.Event()
+    
+    def handle_signal(signum, frame):
+        logging.info(f"收到信号 {signal.Signals(signum).name}，正在退出")
+        stop.set()
+    
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    
+    monitor.start_monitoring()
+    monitor.start_server()
+    if not monitor.server_running:
+        # 无界面模式只靠服务器工作，启动失败时退出，交给服务管理器重启或报警
+        logging.error("HTTP服务器未能启动，退出")
+        monitor.shutdown()
+        return 1
+    for url in monitor.get_server_urls():
+        logging.info(f"访问地址: {url}")
+    try:
+        # 带超时等待，Windows 上也能及时处理 Ctrl+C
+        while not stop.wait(1):
+            pass
+    finally:
+        monitor.shutdown()
+    logging.info("剪贴板监控器已退出")
+    return 0
+
+
+def setup_logging(log_file='clipboard_monitor.log'):
+    """配置日志：同时写入日志文件和控制台"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file, encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def main(argv=None):
     """主函数"""
+    parser = argparse.ArgumentParser(description='剪贴板监控器')
+    parser.add_argument('--headless', action='store_true',
+                        help='无界面模式：只运行监控和服务器（适合没有显示器的服务器）')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args(argv)
+    
+    setup_logging()
     logging.info("剪贴板监控器启动")
     
-    # 检查依赖
-    try:
-        import pyperclip
-        import qrcode
-    except ImportError as e:
-        print(f"缺少必要的依赖: {e}")
-        return
+    # 检查依赖（二维码只有界面模式需要）：只查找模块，真正导入推迟到第一次使用
+    required = ['pyperclip'] if args.headless else ['pyperclip', 'qrcode']
+    missing = [name for name in required if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"缺少必要的依赖: {', '.join(missing)}")
+        return 1
+    
+    if args.headless:
+        return run_headless(args.config)
     
     # 创建并运行GUI
-    app = ClipboardGUI()
+    app = ClipboardGUI(args.config)
     app.run()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 